@@ -0,0 +1,78 @@
+# /benchmarks/bench_html_meta.py
+#
+# Streaming metadata extractor vs. the BeautifulSoup tree, on the saved pages
+# in benchmarks/corpus/html. Checks both paths agree, then reports time and
+# peak allocated memory per page.
+# Run from the repo root:  python -m benchmarks.bench_html_meta
+
+import time
+import tracemalloc
+from pathlib import Path
+
+from bot.parsers import feed
+from bot.parsers.html_meta import extract_metadata
+from bot.parsers.pool import HTML_PARSER
+
+CORPUS = Path(__file__).parent / "corpus" / "html"
+URL = "https://example.com/page"
+ROUNDS = 50
+
+
+def soup_feed_link(html: str, url: str) -> str | None:
+    previous, feed.HTML_EXTRACTOR = feed.HTML_EXTRACTOR, "soup"
+    try:
+        return feed.find_feed_link(html, url)
+    finally:
+        feed.HTML_EXTRACTOR = previous
+
+
+def stream_feed_link(html: str, url: str) -> str | None:
+    href = extract_metadata(html, head_only=True)["feed_href"]
+    return feed.urljoin(url, href) if href else None
+
+
+def check(name: str, html: str):
+    soup = feed.parse_html_document_soup(html, URL)
+    stream = feed.parse_html_document(html, URL)
+    assert soup == stream, (name, soup, stream)
+    assert soup_feed_link(html, URL) == stream_feed_link(html, URL), name
+
+
+def timed(fn, *args) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - started) / ROUNDS
+
+
+def peak_kib(fn, *args) -> float:
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    pages = sorted(CORPUS.glob("*.html"))
+    print(f"{len(pages)} pages, BeautifulSoup backend: {HTML_PARSER}, {ROUNDS} rounds each")
+    print(f"{'page':<28} {'KiB':>6} {'soup ms':>8} {'stream ms':>10} {'speedup':>8} "
+          f"{'soup peak KiB':>14} {'stream peak KiB':>16}")
+    total_soup = total_stream = 0.0
+    for path in pages:
+        html = path.read_text(encoding="utf-8")
+        check(path.name, html)
+        soup_s = timed(feed.parse_html_document_soup, html, URL)
+        stream_s = timed(feed.parse_html_document, html, URL)
+        total_soup += soup_s
+        total_stream += stream_s
+        print(f"{path.name:<28} {len(html) / 1024:>6.1f} {soup_s * 1000:>8.2f} {stream_s * 1000:>10.2f} "
+              f"{soup_s / stream_s:>7.1f}x "
+              f"{peak_kib(feed.parse_html_document_soup, html, URL):>14.0f} "
+              f"{peak_kib(feed.parse_html_document, html, URL):>16.0f}")
+    print(f"{'total':<28} {'':>6} {total_soup * 1000:>8.2f} {total_stream * 1000:>10.2f} "
+          f"{total_soup / total_stream:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
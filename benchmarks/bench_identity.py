@@ -0,0 +1,56 @@
+# /benchmarks/bench_identity.py
+#
+# Replays successive snapshots of the feeds in benchmarks/corpus/feeds and
+# counts how many articles would be sent, and how many dedup rows written,
+# when dedup is keyed on the raw link vs. on the article identity.
+# Each feed publishes one new entry per snapshot, so anything above that is
+# a duplicate send caused by link churn (tracking parameters, http -> https,
+# trailing slashes, fragments).
+# Run from the repo root:  python -m benchmarks.bench_identity
+
+from collections import defaultdict
+from pathlib import Path
+
+from bot.parsers.feed import parse_feed_document
+
+CORPUS = Path(__file__).parent / "corpus" / "feeds"
+
+
+def replay(snapshots: list[bytes], key) -> int:
+    """Return how many articles are sent (= dedup rows written) over all snapshots of one feed."""
+    seen = set()
+    sent = 0
+    for content in snapshots:
+        for article in parse_feed_document(content):
+            article_key = key(article)
+            if article_key not in seen:
+                seen.add(article_key)
+                sent += 1
+    return sent
+
+
+def main():
+    feeds = defaultdict(list)
+    for path in sorted(CORPUS.glob("*.xml"), key=lambda p: (p.stem.rsplit("-", 1)[0], int(p.stem.rsplit("-", 1)[1]))):
+        feeds[path.stem.rsplit("-", 1)[0]].append(path.read_bytes())
+
+    print(f"{'feed':<8} {'snapshots':>9} {'expected':>9} {'link sends':>11} {'id sends':>9} {'dup rate link':>14} {'dup rate id':>12}")
+    totals = [0, 0, 0]
+    for name, snapshots in feeds.items():
+        # The first snapshot's entries plus one new entry per later snapshot
+        expected = len(parse_feed_document(snapshots[0])) + len(snapshots) - 1
+        link_sent = replay(snapshots, lambda article: article["link"])
+        id_sent = replay(snapshots, lambda article: article["id"])
+        totals[0] += expected
+        totals[1] += link_sent
+        totals[2] += id_sent
+        print(f"{name:<8} {len(snapshots):>9} {expected:>9} {link_sent:>11} {id_sent:>9} "
+              f"{(link_sent - expected) / link_sent:>13.0%} {(id_sent - expected) / id_sent:>12.0%}")
+    expected, link_sent, id_sent = totals
+    print(f"{'total':<8} {'':>9} {expected:>9} {link_sent:>11} {id_sent:>9} "
+          f"{(link_sent - expected) / link_sent:>13.0%} {(id_sent - expected) / id_sent:>12.0%}")
+    print(f"dedup rows written: {link_sent} keyed on links, {id_sent} keyed on article IDs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# /benchmarks/bench_render.py
+#
+# Message rendering cost for the articles in benchmarks/corpus/feeds, with
+# each feed followed by several sources: the old path (sanitize_text in the
+# parser, then four chained .replace calls per field for every source)
+# against render_article (one table-driven escape pass per field, one
+# render per article shared by all sources), for each parse mode.
+# Run from the repo root:  python -m benchmarks.bench_render
+
+import timeit
+from pathlib import Path
+
+from bot.delivery.render import ESCAPES, render_article
+from bot.parsers.feed import parse_feed_document
+
+CORPUS = Path(__file__).parent / "corpus" / "feeds"
+SOURCES_PER_FEED = 3
+REPEAT = 200
+
+
+def sanitize_text(text: str) -> str:
+    # utils.sanitize_text, as the parser used to apply it
+    return text.replace("<", "&lt;").replace(">", "&gt;")
+
+
+def render_chained(articles: list[dict]) -> list[str]:
+    texts = []
+    for _ in range(SOURCES_PER_FEED):
+        for article in articles:
+            title, summary = sanitize_text(article["title"]), sanitize_text(article["summary"])
+            safe_title = title.replace('*', '\\*').replace('_', '\\_').replace('[', '\\[').replace(']', '\\]')
+            safe_summary = summary.replace('*', '\\*').replace('_', '\\_').replace('[', '\\[').replace(']', '\\]')
+            texts.append(f"*{safe_title}*\n{safe_summary}\n🔗 {article['link']}")
+    return texts
+
+
+def render_cached(articles: list[dict], parse_mode: str) -> list[str]:
+    texts = []
+    rendered = {}
+    for _ in range(SOURCES_PER_FEED):
+        for article in articles:
+            text = rendered.get(article["id"])
+            if text is None:
+                text = rendered[article["id"]] = render_article(article, parse_mode)
+            texts.append(text)
+    return texts
+
+
+def main():
+    feeds = [parse_feed_document(path.read_bytes()) for path in sorted(CORPUS.glob("*.xml"))]
+    articles = sum(len(feed) for feed in feeds)
+    print(f"{len(feeds)} feeds, {articles} articles, {SOURCES_PER_FEED} sources per feed, {REPEAT} rounds")
+
+    def per_message(fn) -> float:
+        seconds = min(timeit.repeat(fn, number=REPEAT, repeat=3))
+        return seconds / (REPEAT * articles * SOURCES_PER_FEED) * 1e6
+
+    baseline = per_message(lambda: [render_chained(feed) for feed in feeds])
+    print(f"{'chained .replace (Markdown)':<30} {baseline:>7.2f} µs/message")
+    for parse_mode in ESCAPES:
+        cost = per_message(lambda: [render_cached(feed, parse_mode) for feed in feeds])
+        print(f"{'render_article (' + parse_mode + ')':<30} {cost:>7.2f} µs/message  {baseline / cost:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# /benchmarks/bench_ticks.py
+#
+# End-to-end tick benchmark, fully offline. Starts the fake feed server and
+# stub Bot API from benchmarks/fakes.py, then for each scale runs a fresh
+# worker process (its own database and peak RSS) that seeds N sources and
+# drives full fetch_and_forward ticks against them, draining the delivery
+# queue after each one. Tick 1 is cold (every entry is new); later ticks
+# see the configured churn, 304s, unchanged bodies and errors.
+#
+# Reports per scale: fetch throughput, tick latency p50/p95/max over the
+# warm ticks, per-source fetch latency p50/p95, DB round trips per tick,
+# messages sent with their enqueue-to-sent latency, and the worker's peak RSS.
+# With --fetch-workers N the bot shards fetching over N processes; fetch
+# latency and DB round trips then only cover the scheduling process.
+# Run from the repo root:  python -m benchmarks.bench_ticks
+#   python -m benchmarks.bench_ticks --scales 10,100 --ticks 3 --out bench.jsonl
+# --out appends one JSON line per scale (with the git commit) to compare runs over time.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+import aiohttp
+
+from benchmarks.fakes import WORDS, FakeServices, FeedOptions
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of the values (0.0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+# --- Worker: runs inside its own process, imports the bot with the benchmark env ---
+
+async def run_worker(config: dict) -> dict:
+    import aiosqlite
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    from bot.database.core import close_db, init_db
+    from bot.database.queries import add_filter, add_source, add_target, get_or_create_user
+    from bot.delivery.queue import DELIVERY_WORKERS, delivery
+    from bot.parsers.http import http_client
+    from bot.parsers.pool import parser_pool
+    from bot.scheduler import jobs
+    from bot.scheduler.shards import shards
+
+    # Every call that crosses into aiosqlite's thread is one round trip
+    round_trips = [0]
+    original_execute = aiosqlite.Connection._execute
+
+    async def counted_execute(self, fn, *args, **kwargs):
+        round_trips[0] += 1
+        return await original_execute(self, fn, *args, **kwargs)
+
+    aiosqlite.Connection._execute = counted_execute
+
+    fetch_latencies: list[float] = []
+    original_fetch = jobs.engine.fetch
+
+    async def timed_fetch(url: str):
+        started = time.perf_counter()
+        try:
+            return await original_fetch(url)
+        finally:
+            fetch_latencies.append(time.perf_counter() - started)
+
+    jobs.engine.fetch = timed_fetch
+
+    sources = config["sources"]
+    control = config["control_url"]
+    with open(config["urls"]) as f:
+        urls = json.load(f)
+    await init_db()
+
+    # One user per 10 sources; a share of sources are HTML pages found via discovery
+    seed_started = time.perf_counter()
+    html_every = round(1 / config["html_fraction"]) if config["html_fraction"] else 0
+    target_every = round(1 / config["target_fraction"]) if config["target_fraction"] else 0
+    filter_every = round(1 / config["filter_fraction"]) if config["filter_fraction"] else 0
+    for n in range(sources):
+        user_id = await get_or_create_user(100_000 + n // 10)
+        url = urls["pages"][n] if html_every and n % html_every == 0 else urls["feeds"][n]
+        await add_source(user_id, url)
+        if target_every and n % target_every == 0:
+            await add_target(url, 1_000_000 + n)
+        if filter_every and n % filter_every == 1 % filter_every:
+            await add_filter(url, WORDS[n % len(WORDS)])
+    seed_seconds = time.perf_counter() - seed_started
+
+    bot = Bot("123456:benchmark", base_url=config["bot_base_url"],
+              request=HTTPXRequest(connection_pool_size=DELIVERY_WORKERS))
+    ticks = []
+    shards.start(jobs.process_feeds)
+    async with bot, aiohttp.ClientSession() as control_session:
+        for _ in range(config["ticks"]):
+            async with control_session.post(f"{control}/_bench/tick") as response:
+                tick = (await response.json())["tick"]
+            fetch_latencies.clear()
+            sent_before = delivery.stats()["sent"]
+            trips_before = round_trips[0]
+
+            started = time.perf_counter()
+            stats = await jobs.fetch_and_forward(bot, force=True)
+            tick_seconds = time.perf_counter() - started
+            tick_trips = round_trips[0] - trips_before
+
+            drain_started = time.perf_counter()
+            await delivery.join()
+            drain_seconds = time.perf_counter() - drain_started
+
+            ticks.append({
+                "tick": tick,
+                "seconds": tick_seconds,
+                "drain_seconds": drain_seconds,
+                "db_round_trips": tick_trips,
+                "drain_db_round_trips": round_trips[0] - trips_before - tick_trips,
+                "fetched": stats.sources - stats.skipped - stats.leased,
+                "errors": stats.errors,
+                "unchanged": stats.unchanged,
+                "skipped": stats.skipped,
+                "sent": delivery.stats()["sent"] - sent_before,
+                "fetch_p50": percentile(fetch_latencies, 50),
+                "fetch_p95": percentile(fetch_latencies, 95),
+            })
+
+        await delivery.stop()
+    await shards.stop()
+    await http_client.close()
+    parser_pool.close()
+    await close_db()
+
+    return {
+        "sources": sources,
+        "seed_seconds": seed_seconds,
+        "ticks": ticks,
+        "delivery_p50": delivery.stats()["latency_p50"],
+        "delivery_p95": delivery.stats()["latency_p95"],
+        # Linux reports ru_maxrss in KiB
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        # The largest fetch worker, when sharding is on
+        "worker_peak_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+# --- Driver: owns the fake services and one worker process per scale ---
+
+def summarize(result: dict) -> dict:
+    ticks = result["ticks"]
+    warm = ticks[1:] or ticks
+    tick_seconds = [tick["seconds"] for tick in warm]
+    fetched = sum(tick["fetched"] for tick in ticks)
+    sent = sum(tick["sent"] for tick in ticks)
+    return {
+        "sources": result["sources"],
+        "cold_tick_s": ticks[0]["seconds"],
+        "tick_p50_s": percentile(tick_seconds, 50),
+        "tick_p95_s": percentile(tick_seconds, 95),
+        "tick_max_s": max(tick_seconds),
+        "fetch_p50_s": percentile([tick["fetch_p50"] for tick in warm], 50),
+        "fetch_p95_s": percentile([tick["fetch_p95"] for tick in warm], 50),
+        "sources_per_s": fetched / sum(tick["seconds"] for tick in ticks),
+        "db_trips_cold": ticks[0]["db_round_trips"],
+        "db_trips_warm": sum(tick["db_round_trips"] for tick in warm) / len(warm),
+        "db_trips_per_source": sum(tick["db_round_trips"] for tick in warm) / len(warm) / result["sources"],
+        "sent": sent,
+        "drain_s": sum(tick["drain_seconds"] for tick in ticks),
+        "delivery_p50_s": result["delivery_p50"],
+        "delivery_p95_s": result["delivery_p95"],
+        "errors": sum(tick["errors"] for tick in ticks),
+        "unchanged": sum(tick["unchanged"] for tick in ticks),
+        "peak_rss_mib": result["peak_rss_mib"],
+        "worker_peak_rss_mib": result["worker_peak_rss_mib"],
+        "seed_s": result["seed_seconds"],
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_scale(services: FakeServices, args, sources: int) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"http://127.0.0.1:{services.port}/_bench/reset"):
+            pass
+
+    with tempfile.TemporaryDirectory(prefix="bench-ticks-") as tmp:
+        # The worker gets every source URL up front (hosts and port are the server's business)
+        urls_path = os.path.join(tmp, "urls.json")
+        with open(urls_path, "w") as f:
+            json.dump({"feeds": [services.feed_url(n) for n in range(sources)],
+                       "pages": [services.page_url(n) for n in range(sources)]}, f)
+        config = {
+            "sources": sources,
+            "urls": urls_path,
+            "ticks": args.ticks,
+            "html_fraction": args.html_fraction,
+            "target_fraction": args.target_fraction,
+            "filter_fraction": args.filter_fraction,
+            "control_url": f"http://127.0.0.1:{services.port}",
+            "bot_base_url": services.bot_base_url,
+        }
+
+        env = dict(os.environ)
+        env.update({
+            "DB_FILE": os.path.join(tmp, "bench.db"),
+            # Telegram's real limits would make delivery dominate every number
+            "DELIVERY_GLOBAL_RATE": "100000",
+            "DELIVERY_CHAT_RATE": "100000",
+            "FETCH_WORKERS": str(args.fetch_workers),
+            "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")])),
+        })
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmarks.bench_ticks", "--log-level", args.log_level, "--worker", json.dumps(config),
+            # Own process group, so a timeout also takes down its fetch workers
+            env=env, stdout=asyncio.subprocess.PIPE, start_new_session=True,
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), args.timeout)
+        except asyncio.TimeoutError:
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+            raise RuntimeError(f"worker for {sources} sources did not finish within {args.timeout}s")
+        if process.returncode != 0:
+            raise RuntimeError(f"worker for {sources} sources exited with {process.returncode}")
+        return json.loads(stdout.decode().strip().splitlines()[-1])
+
+
+async def drive(args):
+    options = FeedOptions(
+        latency_ms=args.latency_ms, feed_kb=args.feed_kb, entries=args.entries,
+        error_rate=args.error_rate, churn=args.churn, send_latency_ms=args.send_latency_ms,
+    )
+    services = FakeServices(options, hosts=args.hosts)
+    await services.start()
+    commit = git_commit()
+    header = (f"{'sources':>7} {'cold s':>7} {'tick p50':>8} {'p95':>7} {'max':>7} {'fetch p50':>9} {'p95':>6} "
+              f"{'src/s':>7} {'db/tick':>8} {'db/src':>6} {'sent':>6} {'deliv p95':>9} {'errors':>6} {'rss MiB':>8} {'wrk MiB':>8}")
+    print(f"commit {commit}, {args.ticks} ticks per scale, options {asdict(options)}, {args.hosts} hosts, "
+          f"{args.fetch_workers} fetch workers")
+    print(header)
+    try:
+        for sources in args.scales:
+            summary = summarize(await run_scale(services, args, sources))
+            print(f"{summary['sources']:>7} {summary['cold_tick_s']:>7.2f} {summary['tick_p50_s']:>8.2f} "
+                  f"{summary['tick_p95_s']:>7.2f} {summary['tick_max_s']:>7.2f} "
+                  f"{summary['fetch_p50_s'] * 1000:>7.0f}ms {summary['fetch_p95_s'] * 1000:>4.0f}ms "
+                  f"{summary['sources_per_s']:>7.0f} {summary['db_trips_warm']:>8.0f} "
+                  f"{summary['db_trips_per_source']:>6.1f} {summary['sent']:>6} {summary['delivery_p95_s'] * 1000:>7.0f}ms "
+                  f"{summary['errors']:>6} {summary['peak_rss_mib']:>8.1f} {summary['worker_peak_rss_mib']:>8.1f}", flush=True)
+            if args.out:
+                with open(args.out, "a") as f:
+                    f.write(json.dumps({
+                        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                        "commit": commit,
+                        "ticks": args.ticks,
+                        "hosts": args.hosts,
+                        "fetch_workers": args.fetch_workers,
+                        "options": asdict(options),
+                        **summary,
+                    }) + "\n")
+    finally:
+        await services.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end tick benchmark")
+    parser.add_argument("--scales", type=lambda s: [int(n) for n in s.split(",")], default=[10, 100, 1000, 10000])
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--hosts", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--send-latency-ms", type=float, default=5.0)
+    parser.add_argument("--feed-kb", type=float, default=8.0)
+    parser.add_argument("--entries", type=int, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--churn", type=float, default=0.2)
+    parser.add_argument("--html-fraction", type=float, default=0.1)
+    parser.add_argument("--target-fraction", type=float, default=0.1)
+    parser.add_argument("--filter-fraction", type=float, default=0.2)
+    parser.add_argument("--fetch-workers", type=int, default=0, help="FETCH_WORKERS for the bot (0: in-process)")
+    parser.add_argument("--out", help="append one JSON line per scale to this file")
+    parser.add_argument("--timeout", type=float, default=1800, help="give up on a scale after this many seconds")
+    parser.add_argument("--log-level", default="WARNING", help="INFO shows the bot's own log lines")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(json.loads(args.worker)))))
+    else:
+        asyncio.run(drive(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# /benchmarks/fakes.py
+#
+# Local stand-ins for the outside world, used by bench_ticks:
+#   - synthetic RSS feeds and HTML pages that link to them, with configurable
+#     latency, body size and error rate, spread over several loopback hosts
+#     (127.0.0.1, 127.0.0.2, ...) so per-host limits behave as in production;
+#   - a stub Telegram Bot API (getMe, sendMessage) that records every send.
+# Feeds publish new entries when the harness advances the tick, so later
+# ticks see a realistic mix of new, unchanged (304 / same body) and failing feeds.
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+WORDS = ("python", "release", "security", "update", "cloud", "linux", "data", "design",
+         "privacy", "startup", "hardware", "research", "browser", "database", "network")
+
+
+@dataclass
+class FeedOptions:
+    latency_ms: float = 50.0     # mean response delay; each response is within ±50% of it
+    feed_kb: float = 8.0         # approximate RSS body size
+    entries: int = 10            # items per feed
+    error_rate: float = 0.02     # share of requests answered with a 500
+    churn: float = 0.2           # chance that a feed publishes a new entry on each tick
+    etag_every: int = 2          # every n-th feed supports If-None-Match (0: none do)
+    send_latency_ms: float = 5.0  # Bot API response delay
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+    sends: int = 0
+    chats: set[int] = field(default_factory=set)
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "sends": self.sends,
+            "chats": len(self.chats),
+        }
+
+
+class FakeServices:
+    """Serves /feeds/<n>.xml, /pages/<n>, /bot<token>/<method> and the /_bench control routes."""
+
+    def __init__(self, options: FeedOptions, hosts: int = 50, seed: int = 1):
+        self.options = options
+        self.hosts = hosts
+        self.seed = seed
+        self.tick = 0
+        self.stats = ServerStats()
+        self.port = 0
+        self._runner: web.AppRunner | None = None
+        # Latest rendered body per feed, so the server's own CPU time stays out of the numbers
+        self._bodies: dict[int, tuple[int, bytes]] = {}
+        # Per-request randomness (latency, errors), separate from the feed contents
+        self._random = random.Random(seed)
+
+    def host(self, n: int) -> str:
+        return f"127.0.0.{n % self.hosts + 1}:{self.port}"
+
+    def feed_url(self, n: int) -> str:
+        return f"http://{self.host(n)}/feeds/{n}.xml"
+
+    def page_url(self, n: int) -> str:
+        return f"http://{self.host(n)}/pages/{n}"
+
+    @property
+    def bot_base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/feeds/{n}.xml", self._feed)
+        app.router.add_get("/pages/{n}", self._page)
+        app.router.add_post("/bot{token}/{method}", self._bot)
+        app.router.add_post("/_bench/tick", self._advance)
+        app.router.add_post("/_bench/reset", self._reset)
+        app.router.add_get("/_bench/stats", self._stats)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        # One port on every loopback host; the first bind picks it
+        for i in range(self.hosts):
+            site = web.TCPSite(self._runner, f"127.0.0.{i + 1}", self.port)
+            await site.start()
+            if not self.port:
+                self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _published(self, n: int) -> int:
+        """Sequence number of feed n's newest entry at the current tick."""
+        latest = self.options.entries
+        for tick in range(1, self.tick + 1):
+            if random.Random(f"{self.seed}:{n}:{tick}").random() < self.options.churn:
+                latest += 1
+        return latest
+
+    def render_feed(self, n: int, latest: int) -> bytes:
+        rng = random.Random(f"{self.seed}:{n}")
+        filler = max(0, int(self.options.feed_kb * 1024 / max(1, self.options.entries)) - 300)
+        items = []
+        for seq in range(latest, max(0, latest - self.options.entries), -1):
+            words = " ".join(rng.choice(WORDS) for _ in range(6))
+            body = " ".join(rng.choice(WORDS) for _ in range(filler // 8))[:filler]
+            items.append(
+                f"<item><title>Feed {n} entry {seq}: {words}</title>"
+                f"<link>http://{self.host(n)}/articles/{n}/{seq}?utm_source=rss</link>"
+                f"<guid isPermaLink=\"false\">feed-{n}-entry-{seq}</guid>"
+                f"<pubDate>Mon, 01 Jan 2024 00:00:00 GMT</pubDate>"
+                f"<description>{body}</description></item>"
+            )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>Synthetic feed {n}</title><link>http://{self.host(n)}/</link>"
+            f"<description>Benchmark feed</description>{''.join(items)}</channel></rss>"
+        ).encode()
+
+    async def _delay(self, mean_ms: float):
+        if mean_ms > 0:
+            await asyncio.sleep(mean_ms * self._random.uniform(0.5, 1.5) / 1000)
+
+    async def _feed(self, request: web.Request) -> web.Response:
+        self.stats.requests += 1
+        await self._delay(self.options.latency_ms)
+        if self._random.random() < self.options.error_rate:
+            self.stats.errors += 1
+            return web.Response(status=500, text="synthetic failure")
+
+        n = int(request.match_info["n"])
+        latest = self._published(n)
+        headers = {"Content-Type": "application/rss+xml"}
+        if self.options.etag_every and n % self.options.etag_every == 0:
+            etag = f'"{n}-{latest}"'
+            headers["ETag"] = etag
+            if request.headers.get("If-None-Match") == etag:
+                self.stats.not_modified += 1
+                return web.Response(status=304, headers=headers)
+        cached = self._bodies.get(n)
+        if cached is None or cached[0] != latest:
+            cached = self._bodies[n] = (latest, self.render_feed(n, latest))
+        body = cached[1]
+        self.stats.bytes_sent += len(body)
+        return web.Response(body=body, headers=headers)
+
+    async def _page(self, request: web.Request) -> web.Response:
+        self.stats.requests += 1
+        await self._delay(self.options.latency_ms)
+        n = int(request.match_info["n"])
+        html = (
+            f"<!doctype html><html><head><title>Site {n}</title>"
+            f'<link rel="alternate" type="application/rss+xml" href="/feeds/{n}.xml">'
+            f"</head><body><p>Synthetic site {n}.</p></body></html>"
+        )
+        self.stats.bytes_sent += len(html)
+        return web.Response(text=html, content_type="text/html")
+
+    async def _bot(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = await request.post()
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+            }})
+        if method != "sendMessage":
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+        await self._delay(self.options.send_latency_ms)
+        chat_id = int(data["chat_id"])
+        self.stats.sends += 1
+        self.stats.chats.add(chat_id)
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.stats.sends,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data.get("text", ""),
+        }})
+
+    async def _advance(self, request: web.Request) -> web.Response:
+        self.tick += 1
+        return web.json_response({"tick": self.tick})
+
+    async def _reset(self, request: web.Request) -> web.Response:
+        self.tick = 0
+        self.stats = ServerStats()
+        self._random = random.Random(self.seed)
+        self._bodies.clear()
+        return web.json_response({"tick": self.tick})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats.as_dict())
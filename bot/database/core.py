@@ -42,14 +42,119 @@ async def init_db():
         );
         """)
         await db.commit()
+import asyncio
+import hashlib
 import aiosqlite
 import os
+from contextlib import asynccontextmanager
 
-DB_FILE = "feedforwarder.db"
+from utils import get_env_variable
+
+DB_FILE = get_env_variable("DB_FILE", "feedforwarder.db")
+DB_CACHE_KIB = 16384
+DB_STATEMENT_CACHE = 256
+# How long a write waits for another process's transaction (fetch workers share the file)
+DB_BUSY_TIMEOUT_MS = int(get_env_variable("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# ✅ One connection for the whole process; aiosqlite serialises calls on its thread
+_connection: aiosqlite.Connection | None = None
+_open_lock = asyncio.Lock()
+_write_lock = asyncio.Lock()
+
+async def get_db() -> aiosqlite.Connection:
+    """Return the shared connection, opening and tuning it on first use."""
+    global _connection
+    if _connection is not None:
+        return _connection
+    async with _open_lock:
+        if _connection is None:
+            # IMMEDIATE: a write transaction takes the write lock up front (waiting on
+            # busy_timeout), so fetch worker processes sharing the file never hit SQLITE_BUSY mid-transaction
+            db = await aiosqlite.connect(DB_FILE, cached_statements=DB_STATEMENT_CACHE, isolation_level="IMMEDIATE")
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
+            await db.execute("PRAGMA temp_store=MEMORY")
+            await db.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+            _connection = db
+    return _connection
+
+@asynccontextmanager
+async def transaction():
+    """
+    Serialise a write on the shared connection and commit it as one unit.
+    Rolls back and re-raises on error.
+    """
+    db = await get_db()
+    async with _write_lock:
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+@asynccontextmanager
+async def committed_read():
+    """
+    Hold the write lock for a read without opening a transaction. On the
+    shared connection a read otherwise sees rows another task has written
+    but not yet committed (and may still roll back).
+    """
+    db = await get_db()
+    async with _write_lock:
+        yield db
+
+async def close_db():
+    global _connection
+    if _connection is not None:
+        await _connection.close()
+        _connection = None
+
+def article_key(identity: str) -> int:
+    """Signed 64-bit blake2b of an article identity, the dedup key stored in sent_keys."""
+    digest = hashlib.blake2b(identity.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+async def _migrate_sent_articles(db):
+    """Move rows from the old URL-keyed sent_articles table into sent_keys, once."""
+    rows = await db.execute_fetchall(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sent_articles'"
+    )
+    if not rows:
+        return
+    # The sent time column was `timestamp` in the original schema and `sent_at` in later ones
+    columns = {row[1] for row in await db.execute_fetchall("PRAGMA table_info(sent_articles)")}
+    sent_column = next((name for name in ("sent_at", "timestamp") if name in columns), None)
+    now = "CAST(strftime('%s', 'now') AS INTEGER)"
+    sent_at = f"COALESCE(CAST(strftime('%s', {sent_column}) AS INTEGER), {now})" if sent_column else now
+    rows = await db.execute_fetchall(f"SELECT source_id, url, {sent_at} FROM sent_articles")
+    await db.executemany(
+        "INSERT OR IGNORE INTO sent_keys (source_id, key, sent_at) VALUES (?, ?, ?)",
+        [(source_id, article_key(url), sent_at) for source_id, url, sent_at in rows],
+    )
+    await db.execute("DROP TABLE sent_articles")
+
+async def vacuum_db() -> tuple[int, int]:
+    """
+    Checkpoint the WAL and VACUUM the database file, holding the write lock
+    so no transaction is open meanwhile. Returns (bytes before, bytes after).
+    """
+    db = await get_db()
+    async with _write_lock:
+        before = await _db_bytes(db)
+        await db.execute("VACUUM")
+        await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return before, await _db_bytes(db)
+
+async def _db_bytes(db) -> int:
+    (page_count,), = await db.execute_fetchall("PRAGMA page_count")
+    (page_size,), = await db.execute_fetchall("PRAGMA page_size")
+    return page_count * page_size
 
 async def init_db():
     """Initialize the database with required tables."""
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with transaction() as db:
         # Users table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -95,16 +200,101 @@ async def init_db():
             )
         """)
         
-        # Sent articles table for deduplication
+        # Dedup keys: a 64-bit hash of each sent article's ID instead of its URL (sent_at is unix seconds)
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS sent_articles (
+            CREATE TABLE IF NOT EXISTS sent_keys (
+                source_id INTEGER NOT NULL,
+                key INTEGER NOT NULL,
+                sent_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                PRIMARY KEY (source_id, key)
+            ) WITHOUT ROWID
+        """)
+        await _migrate_sent_articles(db)
+
+        # HTTP validators for conditional GET, keyed by the canonical URL the scheduler fetches
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS feed_validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Digests of the last parsed body and of its entry IDs, to skip unchanged feeds (same keys)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS feed_digests (
+                url TEXT PRIMARY KEY,
+                body_digest TEXT,
+                ids_digest TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Feed discovery results for HTML pages (feed_url NULL = no feed found)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS feed_discovery (
+                page_url TEXT PRIMARY KEY,
+                feed_url TEXT,
+                checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Outbox: one row per (source, article, chat) so each target is delivered independently.
+        # Article IDs are only unique within a feed, so the key includes the source.
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 source_id INTEGER NOT NULL,
-                url TEXT NOT NULL,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                article_id TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                parse_mode TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (source_id) REFERENCES sources (id),
-                UNIQUE(source_id, url)
+                UNIQUE(source_id, article_id, chat_id)
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, id)")
+
+        # Circuit breakers for failing sources and hosts (open_until is unix seconds)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS breakers (
+                key TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                open_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # When each periodic maintenance task last finished (unix seconds), so restarts don't postpone it
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                task TEXT PRIMARY KEY,
+                finished_at REAL NOT NULL
+            )
+        """)
+
+        # Fetch leases: which worker process is fetching a feed right now (expires_at is unix seconds)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fetch_leases (
+                feed_url TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+        # Per-feed poll schedule (keyed by canonical feed URL, times are unix seconds)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS feed_schedule (
+                feed_url TEXT PRIMARY KEY,
+                next_due_at REAL NOT NULL,
+                interval_seconds INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        
-        await db.commit()
@@ -0,0 +1,68 @@
+# /bot/database/maintenance.py
+
+import time
+from dataclasses import dataclass
+
+from .core import vacuum_db
+from .queries import get_maintenance_run, prune_outbox, prune_sent_keys, save_maintenance_run
+from utils import get_env_variable, log_info
+
+SENT_RETENTION_DAYS = int(get_env_variable("SENT_RETENTION_DAYS", "30"))
+SENT_KEEP_LATEST = int(get_env_variable("SENT_KEEP_LATEST", "100"))
+OUTBOX_RETENTION_DAYS = int(get_env_variable("OUTBOX_RETENTION_DAYS", "7"))
+MAINTENANCE_HOURS = int(get_env_variable("MAINTENANCE_HOURS", "24"))
+# How often the maintenance loop checks whether compaction is due
+MAINTENANCE_CHECK_SECONDS = int(get_env_variable("MAINTENANCE_CHECK_SECONDS", "3600"))
+
+
+@dataclass
+class CompactionReport:
+    """What one maintenance run removed and how much of the file it gave back."""
+    sent_keys_removed: int = 0
+    outbox_removed: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    seconds: float = 0.0
+
+    @property
+    def reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def summary(self) -> str:
+        return (
+            f"removed {self.sent_keys_removed} sent keys and {self.outbox_removed} outbox rows, "
+            f"{self.bytes_before // 1024} KiB → {self.bytes_after // 1024} KiB "
+            f"(reclaimed {self.reclaimed // 1024} KiB) in {self.seconds:.2f}s"
+        )
+
+
+# ✅ Last run, shown in the admin panel
+last_report: CompactionReport | None = None
+
+
+async def compact_database(vacuum: bool = True) -> CompactionReport:
+    """Apply the retention policy, then VACUUM so the freed pages leave the file."""
+    global last_report
+    started = time.perf_counter()
+    report = CompactionReport()
+    report.sent_keys_removed = await prune_sent_keys(SENT_RETENTION_DAYS, SENT_KEEP_LATEST)
+    report.outbox_removed = await prune_outbox(OUTBOX_RETENTION_DAYS)
+    if vacuum:
+        report.bytes_before, report.bytes_after = await vacuum_db()
+    report.seconds = time.perf_counter() - started
+    log_info(f"🧹 Database compaction: {report.summary()}")
+    last_report = report
+    await save_maintenance_run("compaction", time.time())
+    return report
+
+
+async def compact_if_due(force: bool = False) -> CompactionReport | None:
+    """
+    Compact when the last run stored in the database is MAINTENANCE_HOURS
+    old (or there is none), so a host that restarts or sleeps more often
+    than that still gets compacted. Returns None when it was not due.
+    """
+    finished_at = await get_maintenance_run("compaction")
+    if not force and finished_at is not None and time.time() - finished_at < MAINTENANCE_HOURS * 3600:
+        return None
+    return await compact_database()
@@ -1,144 +1,477 @@
 # /bot/database/queries.py
 
+import time
+
 import aiosqlite
-from .core import DB_FILE
+from .core import article_key, committed_read, get_db, transaction
+from .routing import routing
+
+# Stay well under SQLite's bound-parameter limit
+SQL_CHUNK = 500
+
+# -- Helpers --
+
+async def _fetchone(sql: str, params: tuple = ()):
+    # One call into aiosqlite: a cursor left open between calls would keep a read
+    # snapshot that a write from another process makes stale (instant SQLITE_BUSY)
+    db = await get_db()
+    rows = await db.execute_fetchall(sql, params)
+    return rows[0] if rows else None
+
+async def _fetchall(sql: str, params: tuple = ()) -> list:
+    db = await get_db()
+    return list(await db.execute_fetchall(sql, params))
+
+async def _forget_feed_state(db, source_url: str):
+    """Drop the digests and validators of the feed a source URL is fetched as, so it is downloaded and parsed once more."""
+    # Imported here: bot.parsers.feed imports this module
+    from bot.parsers.feed import canonical_feed_url
+
+    key = canonical_feed_url(source_url)
+    await db.execute("DELETE FROM feed_digests WHERE url = ?", (key,))
+    await db.execute("DELETE FROM feed_validators WHERE url = ?", (key,))
 
 # -- User Management --
 
 async def get_or_create_user(telegram_id: int) -> int:
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with transaction() as db:
         await db.execute("INSERT OR IGNORE INTO users (telegram_id) VALUES (?)", (telegram_id,))
-        await db.commit()
-        cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-        row = await cursor.fetchone()
-        return row[0] if row else None
+    row = await _fetchone("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
+    return row[0] if row else None
 
 # -- Source Management --
 
 async def add_source(user_id: int, url: str) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
-        try:
+    try:
+        async with transaction() as db:
             await db.execute("INSERT INTO sources (user_id, url) VALUES (?, ?)", (user_id, url))
-            await db.commit()
-            return True
-        except aiosqlite.IntegrityError:
-            return False
+            # A new source must see the current entries once, even if the feed is unchanged
+            await _forget_feed_state(db, url)
+        routing.invalidate()
+        return True
+    except aiosqlite.IntegrityError:
+        return False
 
 async def remove_source(user_id: int, url: str) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with transaction() as db:
         cursor = await db.execute(
             "DELETE FROM sources WHERE user_id = ? AND url = ?", (user_id, url)
         )
-        await db.commit()
-        return cursor.rowcount > 0
+    if cursor.rowcount > 0:
+        routing.invalidate()
+        return True
+    return False
 
 async def get_sources(user_id: int) -> list[str]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT url FROM sources WHERE user_id = ?", (user_id,))
-        return [row[0] for row in await cursor.fetchall()]
+    rows = await _fetchall("SELECT url FROM sources WHERE user_id = ?", (user_id,))
+    return [row[0] for row in rows]
 
 # -- Target Management --
 
 async def add_target(source_url: str, chat_id: int) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT id FROM sources WHERE url = ?", (source_url,))
-        row = await cursor.fetchone()
-        if not row:
-            return False
-        source_id = row[0]
-        try:
+    row = await _fetchone("SELECT id FROM sources WHERE url = ?", (source_url,))
+    if not row:
+        return False
+    source_id = row[0]
+    try:
+        async with transaction() as db:
             await db.execute("INSERT INTO targets (source_id, chat_id) VALUES (?, ?)", (source_id, chat_id))
-            await db.commit()
-            return True
-        except aiosqlite.IntegrityError:
-            return False
+        routing.invalidate()
+        return True
+    except aiosqlite.IntegrityError:
+        return False
 
 async def get_targets_by_source(source_url: str) -> list[int]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("""
-            SELECT t.chat_id FROM targets t
-            JOIN sources s ON t.source_id = s.id
-            WHERE s.url = ?
-        """, (source_url,))
-        return [row[0] for row in await cursor.fetchall()]
+    rows = await _fetchall("""
+        SELECT t.chat_id FROM targets t
+        JOIN sources s ON t.source_id = s.id
+        WHERE s.url = ?
+    """, (source_url,))
+    return [row[0] for row in rows]
 
 # -- Filter Management --
 
 async def add_filter(source_url: str, keyword: str) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT id FROM sources WHERE url = ?", (source_url,))
-        row = await cursor.fetchone()
-        if not row:
-            return False
-        source_id = row[0]
-        try:
+    row = await _fetchone("SELECT id FROM sources WHERE url = ?", (source_url,))
+    if not row:
+        return False
+    source_id = row[0]
+    try:
+        async with transaction() as db:
             await db.execute("INSERT INTO filters (source_id, keyword) VALUES (?, ?)", (source_id, keyword))
-            await db.commit()
-            return True
-        except aiosqlite.IntegrityError:
-            return False
+        routing.invalidate()
+        return True
+    except aiosqlite.IntegrityError:
+        return False
 
 async def get_filters_by_source(source_url: str) -> list[str]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("""
-            SELECT f.keyword FROM filters f
-            JOIN sources s ON f.source_id = s.id
-            WHERE s.url = ?
-        """, (source_url,))
-        return [row[0] for row in await cursor.fetchall()]
+    rows = await _fetchall("""
+        SELECT f.keyword FROM filters f
+        JOIN sources s ON f.source_id = s.id
+        WHERE s.url = ?
+    """, (source_url,))
+    return [row[0] for row in rows]
 
 # -- Article Deduplication --
 
-async def is_article_sent(source_url: str, article_url: str) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT id FROM sources WHERE url = ?", (source_url,))
-        row = await cursor.fetchone()
-        if not row:
-            return False
-        source_id = row[0]
+async def is_article_sent(source_url: str, article_id: str) -> bool:
+    return not await get_unsent_ids(source_url, [article_id])
+
+async def mark_article_sent(source_url: str, article_id: str):
+    await mark_articles_sent(source_url, [article_id])
+
+async def get_unsent_ids(source_url: str, article_ids: list[str],
+                         aliases: list[str] | None = None) -> list[str]:
+    """
+    Return the article IDs not yet sent for this source, in input order, with
+    one query per chunk. aliases[i], if given, is an older key for
+    article_ids[i] (the raw link, as dedup used before article identities)
+    and counts as sent too.
+    """
+    keys = {article_key(article_id): article_id for article_id in article_ids}
+    alias_keys = {}
+    for article_id, alias in zip(article_ids, aliases or ()):
+        alias_keys.setdefault(article_key(alias), []).append(article_id)
+
+    sent_ids = set()
+    unique = list(keys.keys() | alias_keys.keys())
+    for i in range(0, len(unique), SQL_CHUNK):
+        chunk = unique[i:i + SQL_CHUNK]
+        rows = await _fetchall(f"""
+            SELECT key FROM sent_keys
+            WHERE source_id = (SELECT id FROM sources WHERE url = ? LIMIT 1)
+              AND key IN ({",".join("?" * len(chunk))})
+        """, (source_url, *chunk))
+        for (key,) in rows:
+            if key in keys:
+                sent_ids.add(keys[key])
+            sent_ids.update(alias_keys.get(key, ()))
+    return [article_id for article_id in keys.values() if article_id not in sent_ids]
+
+async def mark_articles_sent(source_url: str, article_ids: list[str]):
+    """Record a batch of sent article IDs for this source in one transaction."""
+    if not article_ids:
+        return
+    async with transaction() as db:
+        await _insert_sent(db, source_url, article_ids)
+
+async def _insert_sent(db, source_url: str, article_ids: list[str]):
+    await db.executemany("""
+        INSERT OR IGNORE INTO sent_keys (source_id, key)
+        SELECT id, ? FROM sources WHERE url = ? LIMIT 1
+    """, [(article_key(article_id), source_url) for article_id in article_ids])
+
+async def prune_sent_keys(retention_days: int, keep_latest: int) -> int:
+    """
+    Drop dedup keys older than retention_days, except each source's
+    keep_latest most recent ones (which cover the entries still in its feed),
+    and keys of sources that no longer exist. Returns rows deleted.
+    """
+    async with transaction() as db:
+        cursor = await db.execute("""
+            DELETE FROM sent_keys
+            WHERE sent_at < CAST(strftime('%s', 'now') AS INTEGER) - ? * 86400
+              AND (source_id, key) NOT IN (
+                  SELECT source_id, key FROM (
+                      SELECT source_id, key,
+                             ROW_NUMBER() OVER (PARTITION BY source_id ORDER BY sent_at DESC) AS recent
+                      FROM sent_keys
+                  ) WHERE recent <= ?
+              )
+        """, (retention_days, keep_latest))
+        deleted = cursor.rowcount
+        cursor = await db.execute("DELETE FROM sent_keys WHERE source_id NOT IN (SELECT id FROM sources)")
+        return deleted + cursor.rowcount
+
+# -- Outbox --
+
+async def queue_articles(source_url: str, messages: list[tuple[str, str]], chat_ids: list[int],
+                         parse_mode: str | None = "Markdown"):
+    """
+    Write an outbox row per (article, chat) and mark the articles as seen,
+    in the same transaction, so a crash can neither lose nor repeat them.
+    `messages` is a list of (article_id, text); an article ID is unique per
+    source and chat.
+    """
+    if not messages:
+        return
+    async with transaction() as db:
+        await db.executemany("""
+            INSERT OR IGNORE INTO outbox (source_id, article_id, chat_id, text, parse_mode)
+            SELECT id, ?, ?, ?, ? FROM sources WHERE url = ? LIMIT 1
+        """, [
+            (article_id, chat_id, text, parse_mode, source_url)
+            for article_id, text in messages
+            for chat_id in chat_ids
+        ])
+        await _insert_sent(db, source_url, [article_id for article_id, _ in messages])
+
+async def load_pending_outbox(per_chat: int, limit: int) -> list[tuple]:
+    """
+    Committed pending rows, at most the `per_chat` oldest of each chat, oldest
+    first: (id, chat_id, text, parse_mode, attempts). The per-chat cap keeps
+    one chat's backlog from filling the delivery queue ahead of everyone
+    else. The read waits for open writes: a row from a queue_articles that
+    later rolls back would otherwise be sent unmarked.
+    """
+    async with committed_read() as db:
+        return list(await db.execute_fetchall("""
+            SELECT id, chat_id, text, parse_mode, attempts FROM (
+                SELECT id, chat_id, text, parse_mode, attempts,
+                       ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id) AS position
+                FROM outbox WHERE state = 'pending'
+            )
+            WHERE position <= ?
+            ORDER BY id LIMIT ?
+        """, (per_chat, limit)))
+
+async def finish_outbox(outbox_id: int, state: str, attempts: int, error: str | None = None):
+    async with transaction() as db:
+        await db.execute("""
+            UPDATE outbox SET state = ?, attempts = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (state, attempts, error, outbox_id))
+
+async def prune_outbox(retention_days: int) -> int:
+    """Drop delivered and failed outbox rows older than retention_days. Returns rows deleted."""
+    async with transaction() as db:
+        cursor = await db.execute("""
+            DELETE FROM outbox
+            WHERE state != 'pending' AND updated_at < datetime('now', ?)
+        """, (f"-{retention_days} days",))
+        return cursor.rowcount
+
+async def get_outbox_counts() -> dict[str, int]:
+    rows = await _fetchall("SELECT state, COUNT(*) FROM outbox GROUP BY state")
+    return dict(rows)
+
+# -- Conditional GET Validators --
+
+async def get_validators(url: str) -> tuple[str | None, str | None]:
+    row = await _fetchone(
+        "SELECT etag, last_modified FROM feed_validators WHERE url = ?", (url,)
+    )
+    return (row[0], row[1]) if row else (None, None)
+
+async def save_validators(url: str, etag: str | None, last_modified: str | None):
+    async with transaction() as db:
+        await db.execute("""
+            INSERT INTO feed_validators (url, etag, last_modified, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                updated_at = CURRENT_TIMESTAMP
+        """, (url, etag, last_modified))
+
+# -- Content Digests --
+
+async def get_feed_digests(url: str) -> tuple[str | None, str | None]:
+    row = await _fetchone("SELECT body_digest, ids_digest FROM feed_digests WHERE url = ?", (url,))
+    return (row[0], row[1]) if row else (None, None)
+
+async def save_feed_digests(url: str, body_digest: str, ids_digest: str | None):
+    async with transaction() as db:
+        await db.execute("""
+            INSERT INTO feed_digests (url, body_digest, ids_digest, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                body_digest = excluded.body_digest,
+                ids_digest = excluded.ids_digest,
+                updated_at = CURRENT_TIMESTAMP
+        """, (url, body_digest, ids_digest))
+
+# -- Feed Discovery Cache --
+
+async def get_discovered_feed(page_url: str, ttl_hours: int, negative_ttl_hours: int) -> tuple[bool, str | None]:
+    """
+    Return (hit, feed_url) for a page. hit is False when there is no fresh entry;
+    a hit with feed_url None means the page is known to have no feed.
+    """
+    row = await _fetchone("""
+        SELECT feed_url FROM feed_discovery
+        WHERE page_url = ? AND checked_at > datetime('now',
+            CASE WHEN feed_url IS NULL THEN ? ELSE ? END)
+    """, (page_url, f"-{negative_ttl_hours} hours", f"-{ttl_hours} hours"))
+    return (True, row[0]) if row else (False, None)
+
+async def save_discovered_feed(page_url: str, feed_url: str | None):
+    async with transaction() as db:
+        await db.execute("""
+            INSERT INTO feed_discovery (page_url, feed_url, checked_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(page_url) DO UPDATE SET
+                feed_url = excluded.feed_url,
+                checked_at = CURRENT_TIMESTAMP
+        """, (page_url, feed_url))
+
+async def forget_discovered_feed(page_url: str):
+    async with transaction() as db:
+        await db.execute("DELETE FROM feed_discovery WHERE page_url = ?", (page_url,))
+
+# -- Poll Schedule --
+
+async def get_feed_schedule() -> dict[str, tuple[float, int]]:
+    """Map each scheduled feed URL to (next_due_at, interval_seconds)."""
+    rows = await _fetchall("SELECT feed_url, next_due_at, interval_seconds FROM feed_schedule")
+    return {url: (due, interval) for url, due, interval in rows}
+
+async def save_feed_schedule(rows: list[tuple[str, float, int]]):
+    """Upsert (feed_url, next_due_at, interval_seconds) rows in one transaction."""
+    if not rows:
+        return
+    async with transaction() as db:
+        await db.executemany("""
+            INSERT INTO feed_schedule (feed_url, next_due_at, interval_seconds, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(feed_url) DO UPDATE SET
+                next_due_at = excluded.next_due_at,
+                interval_seconds = excluded.interval_seconds,
+                updated_at = CURRENT_TIMESTAMP
+        """, rows)
+
+# -- Maintenance Runs --
+
+async def get_maintenance_run(task: str) -> float | None:
+    row = await _fetchone("SELECT finished_at FROM maintenance_runs WHERE task = ?", (task,))
+    return row[0] if row else None
+
+async def save_maintenance_run(task: str, finished_at: float):
+    async with transaction() as db:
+        await db.execute("""
+            INSERT INTO maintenance_runs (task, finished_at) VALUES (?, ?)
+            ON CONFLICT(task) DO UPDATE SET finished_at = excluded.finished_at
+        """, (task, finished_at))
+
+# -- Fetch Leases --
+
+async def acquire_leases(feed_urls: list[str], owner: str, ttl_seconds: float) -> list[str]:
+    """
+    Take or renew a lease on each feed URL for ttl_seconds, unless another
+    owner holds an unexpired one. Returns the URLs this owner now holds.
+    """
+    if not feed_urls:
+        return []
+    now = time.time()
+    async with transaction() as db:
+        await db.executemany("""
+            INSERT INTO fetch_leases (feed_url, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(feed_url) DO UPDATE SET
+                owner = excluded.owner,
+                expires_at = excluded.expires_at
+            WHERE fetch_leases.owner = excluded.owner OR fetch_leases.expires_at < ?
+        """, [(url, owner, now + ttl_seconds, now) for url in feed_urls])
+    held = []
+    for i in range(0, len(feed_urls), SQL_CHUNK):
+        chunk = feed_urls[i:i + SQL_CHUNK]
+        rows = await _fetchall(f"""
+            SELECT feed_url FROM fetch_leases
+            WHERE owner = ? AND feed_url IN ({",".join("?" * len(chunk))})
+        """, (owner, *chunk))
+        held.extend(url for (url,) in rows)
+    return held
+
+async def release_leases(feed_urls: list[str], owner: str):
+    if not feed_urls:
+        return
+    async with transaction() as db:
+        await db.executemany(
+            "DELETE FROM fetch_leases WHERE feed_url = ? AND owner = ?", [(url, owner) for url in feed_urls]
+        )
+
+async def get_lease_owners(host: str) -> list[str]:
+    """Distinct owners ("host:pid") of the leases held by processes on `host`."""
+    prefix = f"{host}:"
+    rows = await _fetchall(
+        "SELECT DISTINCT owner FROM fetch_leases WHERE substr(owner, 1, ?) = ?", (len(prefix), prefix)
+    )
+    return [owner for (owner,) in rows]
+
+async def release_owner_leases(owners: list[str]) -> int:
+    """Delete every lease held by the given owners. Returns rows deleted."""
+    if not owners:
+        return 0
+    async with transaction() as db:
         cursor = await db.execute(
-            "SELECT id FROM sent_articles WHERE source_id = ? AND url = ?", (source_id, article_url)
+            f"DELETE FROM fetch_leases WHERE owner IN ({','.join('?' * len(owners))})", owners
         )
-        return bool(await cursor.fetchone())
-
-async def mark_article_sent(source_url: str, article_url: str):
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT id FROM sources WHERE url = ?", (source_url,))
-        row = await cursor.fetchone()
-        if not row:
-            return
-        source_id = row[0]
-        await db.execute("INSERT OR IGNORE INTO sent_articles (source_id, url) VALUES (?, ?)", (source_id, article_url))
-        await db.commit()
+        return cursor.rowcount
+
+# -- Circuit Breakers --
+
+async def load_breakers() -> list[tuple]:
+    return await _fetchall("SELECT key, failures, open_until, last_error FROM breakers")
+
+async def save_breakers(rows: list[tuple[str, int, float, str]], cleared: list[str]):
+    """Upsert (key, failures, open_until, last_error) rows and delete the cleared keys."""
+    if not rows and not cleared:
+        return
+    async with transaction() as db:
+        await db.executemany("""
+            INSERT INTO breakers (key, failures, open_until, last_error, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(key) DO UPDATE SET
+                failures = excluded.failures,
+                open_until = excluded.open_until,
+                last_error = excluded.last_error,
+                updated_at = CURRENT_TIMESTAMP
+        """, rows)
+        await db.executemany("DELETE FROM breakers WHERE key = ?", [(key,) for key in cleared])
+
+async def get_open_breakers(limit: int = 10) -> list[tuple]:
+    """Currently open breakers, the ones that stay closed longest first."""
+    return await _fetchall("""
+        SELECT key, failures, open_until, last_error FROM breakers
+        WHERE open_until > CAST(strftime('%s', 'now') AS REAL)
+        ORDER BY open_until DESC LIMIT ?
+    """, (limit,))
 
 async def remove_target(source_url: str, chat_id: int) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with transaction() as db:
         cursor = await db.execute("""
             DELETE FROM targets
             WHERE chat_id = ? AND source_id IN (
                 SELECT id FROM sources WHERE url = ?
             )
         """, (chat_id, source_url))
-        await db.commit()
-        return cursor.rowcount > 0
+    if cursor.rowcount > 0:
+        routing.invalidate()
+        return True
+    return False
 
 async def remove_filter(source_url: str, keyword: str) -> bool:
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with transaction() as db:
         cursor = await db.execute("""
             DELETE FROM filters
             WHERE keyword = ? AND source_id IN (
                 SELECT id FROM sources WHERE url = ?
             )
         """, (keyword, source_url))
-        await db.commit()
-        return cursor.rowcount > 0
+        if cursor.rowcount > 0:
+            # Entries the filter used to hide may now pass, so re-parse this feed once
+            await _forget_feed_state(db, source_url)
+    if cursor.rowcount > 0:
+        routing.invalidate()
+        return True
+    return False
 
 async def get_admin_stats() -> dict:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor1 = await db.execute("SELECT COUNT(*) FROM users")
-        users = (await cursor1.fetchone())[0]
-        cursor2 = await db.execute("SELECT COUNT(*) FROM sources")
-        sources = (await cursor2.fetchone())[0]
-        cursor3 = await db.execute("SELECT COUNT(*) FROM targets")
-        targets = (await cursor3.fetchone())[0]
-        return {"users": users, "sources": sources, "targets": targets}
+    row = await _fetchone("""
+        SELECT
+            (SELECT COUNT(*) FROM users),
+            (SELECT COUNT(*) FROM sources),
+            (SELECT COUNT(*) FROM targets),
+            (SELECT COUNT(*) FROM breakers WHERE open_until > CAST(strftime('%s', 'now') AS REAL))
+    """)
+    outbox = await get_outbox_counts()
+    breakers = await get_open_breakers()
+    return {
+        "users": row[0],
+        "sources": row[1],
+        "targets": row[2],
+        "routing_rebuilds": routing.rebuilds,
+        "outbox_pending": outbox.get("pending", 0),
+        "outbox_failed": outbox.get("failed", 0),
+        "breakers_open": row[3],
+        "open_breakers": breakers,
+    }
@@ -0,0 +1,96 @@
+# /bot/database/routing.py
+
+import asyncio
+from dataclasses import dataclass, field
+
+from .core import get_db
+from bot.filters.keywords import KeywordMatcher, compile_keywords
+from utils import log_info
+
+
+@dataclass
+class Subscription:
+    """One row of `sources`: a user following a feed URL."""
+    source_id: int
+    user_id: int
+    url: str
+
+
+@dataclass
+class RoutingSnapshot:
+    """Sources, targets and filters loaded in one go for the tick loop."""
+    subscriptions: list[Subscription] = field(default_factory=list)
+    targets_by_url: dict[str, list[int]] = field(default_factory=dict)
+    filters_by_url: dict[str, list[str]] = field(default_factory=dict)
+    matchers: dict[str, KeywordMatcher | None] = field(default_factory=dict)
+
+    def targets(self, url: str) -> list[int]:
+        return self.targets_by_url.get(url, [])
+
+    def filters(self, url: str) -> list[str]:
+        return self.filters_by_url.get(url, [])
+
+    def matcher(self, url: str) -> KeywordMatcher | None:
+        """Compiled filters for a source, or None when it has no filters."""
+        if url not in self.matchers:
+            keywords = self.filters(url)
+            self.matchers[url] = compile_keywords(tuple(sorted(keywords))) if keywords else None
+        return self.matchers[url]
+
+
+class RoutingTable:
+    """
+    In-process copy of the routing tables. Loaded on first use and rebuilt
+    only after a write in queries.py calls invalidate().
+    """
+
+    def __init__(self):
+        self.rebuilds = 0
+        self._snapshot: RoutingSnapshot | None = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._generation += 1
+        self._snapshot = None
+
+    async def get(self) -> RoutingSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        async with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            generation = self._generation
+            snapshot = await self._load()
+            self.rebuilds += 1
+            # A write landed while loading, so serve this copy but rebuild next time
+            if generation == self._generation:
+                self._snapshot = snapshot
+            log_info(f"🧭 Routing table rebuilt ({len(snapshot.subscriptions)} subscriptions, rebuild #{self.rebuilds})")
+            return snapshot
+
+    async def _load(self) -> RoutingSnapshot:
+        db = await get_db()
+        snapshot = RoutingSnapshot()
+        for source_id, user_id, url in await db.execute_fetchall(
+            "SELECT id, user_id, url FROM sources ORDER BY user_id, id"
+        ):
+            snapshot.subscriptions.append(Subscription(source_id, user_id, url))
+
+        for url, chat_id in await db.execute_fetchall("""
+            SELECT s.url, t.chat_id FROM targets t
+            JOIN sources s ON t.source_id = s.id
+        """):
+            snapshot.targets_by_url.setdefault(url, []).append(chat_id)
+
+        for url, keyword in await db.execute_fetchall("""
+            SELECT s.url, f.keyword FROM filters f
+            JOIN sources s ON f.source_id = s.id
+        """):
+            snapshot.filters_by_url.setdefault(url, []).append(keyword)
+        return snapshot
+
+
+# ✅ Shared by the scheduler and the write paths in queries.py
+routing = RoutingTable()
@@ -0,0 +1,248 @@
+# /bot/delivery/queue.py
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from bot.delivery.limiter import TokenBucket
+from bot.database.queries import finish_outbox, load_pending_outbox
+from bot.metrics import registry
+from utils import get_env_variable, log_info
+
+DELIVERY_WORKERS = int(get_env_variable("DELIVERY_WORKERS", "8"))
+DELIVERY_GLOBAL_RATE = float(get_env_variable("DELIVERY_GLOBAL_RATE", "30"))
+DELIVERY_CHAT_RATE = float(get_env_variable("DELIVERY_CHAT_RATE", "1"))
+DELIVERY_MAX_ATTEMPTS = int(get_env_variable("DELIVERY_MAX_ATTEMPTS", "5"))
+DELIVERY_BATCH = int(get_env_variable("DELIVERY_BATCH", "200"))
+# Rows of one chat held in memory at a time; the rest of its backlog waits in SQLite
+DELIVERY_CHAT_BACKLOG = int(get_env_variable("DELIVERY_CHAT_BACKLOG", "10"))
+OUTBOX_POLL_SECONDS = 30
+MAX_BACKOFF_SECONDS = 60
+
+SEND_SECONDS = registry.histogram("send_seconds", "Duration of one Bot API send_message call")
+DELIVERY_SECONDS = registry.histogram("delivery_seconds", "Time from loading an outbox row to delivering it",
+                                      buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                                               30.0, 60.0, 300.0, 900.0))
+ENQUEUED = registry.counter("delivery_enqueued_total", "Outbox rows loaded into the delivery queue")
+MESSAGES = registry.counter("messages_total", "Outgoing messages by result", ("result",))
+MESSAGE_RESULTS = ("sent", "failed", "retried", "rate_limited")
+
+
+@dataclass
+class OutboundMessage:
+    outbox_id: int
+    chat_id: int
+    text: str
+    parse_mode: str | None = "Markdown"
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class DeliveryQueue:
+    """
+    Outbound Telegram sends, decoupled from fetching.
+
+    The scheduler writes rows to the `outbox` table; a feeder task loads
+    pending rows in batches (including leftovers from before a restart), at
+    most `chat_backlog` per chat so a slow or throttled chat cannot crowd
+    out the others, and every finished row is written back as sent or failed. In memory,
+    messages queue per chat. Worker tasks take whichever chat is ready next,
+    so one chat is only ever sent by one worker at a time (keeping its order).
+    A global token bucket caps the bot-wide rate and per-chat buckets cap each
+    chat. RetryAfter and network errors push that chat back instead of blocking a worker.
+    """
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, global_rate: float = DELIVERY_GLOBAL_RATE,
+                 chat_rate: float = DELIVERY_CHAT_RATE, max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+                 batch_size: int = DELIVERY_BATCH, chat_backlog: int = DELIVERY_CHAT_BACKLOG):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chat_backlog = chat_backlog
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        # Messages loaded from the outbox and not yet finished
+        self.depth = 0
+        self.bot: Bot | None = None
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._chats: dict[int, deque[OutboundMessage]] = {}
+        self._ready: asyncio.Queue[int] | None = None
+        self._drained: asyncio.Event | None = None
+        self._wakeup: asyncio.Event | None = None
+        # Outbox ids in memory, until their result is recorded (the feeder must not load them twice)
+        self._loaded: set[int] = set()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, bot: Bot):
+        if self.running:
+            return
+        self.bot = bot
+        self._ready = asyncio.Queue()
+        self._drained = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._feeder()))
+        log_info(f"📮 Delivery queue started with {self.workers} workers")
+
+    def stats(self) -> dict:
+        """Counts since start, read from the metrics registry, plus the current depth."""
+        return {
+            "enqueued": int(ENQUEUED.get()),
+            **{result: int(MESSAGES.get(result=result)) for result in MESSAGE_RESULTS},
+            "depth": self.depth,
+            "latency_p50": DELIVERY_SECONDS.percentile(50),
+            "latency_p95": DELIVERY_SECONDS.percentile(95),
+        }
+
+    def notify(self):
+        """Tell the feeder that new outbox rows were written."""
+        if self._wakeup is not None:
+            self._drained.clear()
+            self._wakeup.set()
+
+    def _enqueue(self, message: OutboundMessage):
+        self._loaded.add(message.outbox_id)
+        pending = self._chats.get(message.chat_id)
+        if pending is None:
+            pending = self._chats[message.chat_id] = deque()
+            self._ready.put_nowait(message.chat_id)
+        pending.append(message)
+        self.depth += 1
+        ENQUEUED.inc()
+
+    async def join(self):
+        """Wait until the outbox has nothing pending that this queue could load."""
+        if self._drained is not None:
+            await self._drained.wait()
+
+    async def _feeder(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            # Keep about a batch in memory, a few rows per chat; the rest waits in SQLite.
+            # Rows already in memory come back from the query too, hence the larger limit.
+            if self.depth < self.batch_size:
+                try:
+                    rows = await load_pending_outbox(self.chat_backlog, len(self._loaded) + self.batch_size)
+                except Exception as e:
+                    log_info(f"❌ Could not load outbox: {e}")
+                    rows = []
+                for outbox_id, chat_id, text, parse_mode, attempts in rows:
+                    if outbox_id not in self._loaded:
+                        self._enqueue(OutboundMessage(outbox_id, chat_id, text, parse_mode, attempts))
+
+            if self.depth == 0:
+                self._drained.set()
+
+    async def stop(self, timeout: float = 10.0):
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            log_info(f"⚠️ Delivery queue stopped with {self.depth} messages pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log_info(f"📮 Delivery queue stopped: {self.stats()}")
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    def _requeue_later(self, chat_id: int, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            pending = self._chats[chat_id]
+            bucket = self._bucket(chat_id)
+
+            # Chat is throttled: hand it back later and serve someone else
+            wait = bucket.wait_time()
+            if wait > 0:
+                self._requeue_later(chat_id, wait)
+                continue
+
+            bucket.reserve()
+            await self._global.acquire()
+            message = pending[0]
+            state, error = await self._send(message, bucket)
+            if state is not None:
+                pending.popleft()
+                self.depth -= 1
+                await self._record(message, state, error)
+                self._loaded.discard(message.outbox_id)
+
+            if pending:
+                self._requeue_later(chat_id, bucket.wait_time())
+            else:
+                # The chat may have more rows waiting behind its backlog cap
+                del self._chats[chat_id]
+                self._wakeup.set()
+
+    async def _record(self, message: OutboundMessage, state: str, error: str | None):
+        try:
+            await finish_outbox(message.outbox_id, state, message.attempts, error)
+        except Exception as e:
+            log_info(f"❌ Could not record outbox row {message.outbox_id}: {e}")
+
+    async def _send(self, message: OutboundMessage, bucket: TokenBucket) -> tuple[str | None, str | None]:
+        """
+        Send one message. Returns (state, error) where state is "sent" or
+        "failed" when the row is finished, or None to try again later.
+        """
+        try:
+            with SEND_SECONDS.time():
+                await self.bot.send_message(chat_id=message.chat_id, text=message.text, parse_mode=message.parse_mode)
+        except RetryAfter as e:
+            MESSAGES.inc(result="rate_limited")
+            bucket.pause(float(e.retry_after))
+            log_info(f"⏳ Flood control for {message.chat_id}, retrying in {e.retry_after}s")
+            return None, None
+        except BadRequest as e:
+            MESSAGES.inc(result="failed")
+            log_info(f"❌ Rejected by Telegram for {message.chat_id}: {e}")
+            return "failed", str(e)
+        except NetworkError as e:
+            message.attempts += 1
+            if message.attempts >= self.max_attempts:
+                MESSAGES.inc(result="failed")
+                log_info(f"❌ Failed to send to {message.chat_id} after {message.attempts} attempts: {e}")
+                return "failed", str(e)
+            MESSAGES.inc(result="retried")
+            bucket.pause(min(2 ** message.attempts, MAX_BACKOFF_SECONDS))
+            return None, None
+        except Exception as e:
+            MESSAGES.inc(result="failed")
+            log_info(f"❌ Failed to send to {message.chat_id}: {e}")
+            return "failed", str(e)
+
+        message.attempts += 1
+        MESSAGES.inc(result="sent")
+        DELIVERY_SECONDS.observe(time.monotonic() - message.enqueued_at)
+        log_info(f"✅ Sent to {message.chat_id}")
+        return "sent", None
+
+
+# ✅ Owned by main.run; the scheduler only writes outbox rows and calls notify()
+delivery = DeliveryQueue()
+registry.gauge("delivery_queue_depth", "Messages loaded from the outbox and not yet finished",
+               lambda: delivery.depth)
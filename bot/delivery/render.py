@@ -0,0 +1,86 @@
+# /bot/delivery/render.py
+
+from utils import get_env_variable
+
+# HTML (default), MarkdownV2 or the legacy Markdown the bot used to send
+MESSAGE_PARSE_MODE = get_env_variable("MESSAGE_PARSE_MODE", "HTML")
+MAX_TITLE_CHARS = int(get_env_variable("MAX_TITLE_CHARS", "256"))
+MAX_SUMMARY_CHARS = int(get_env_variable("MAX_SUMMARY_CHARS", "1000"))
+# Telegram's limit for one text message, in UTF-16 code units after entity parsing
+MAX_MESSAGE_CHARS = 4096
+ELLIPSIS = "…"
+
+# ✅ Characters to escape per parse mode, applied in order (the escape character itself first)
+ESCAPES = {
+    "HTML": (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")),
+    "MarkdownV2": tuple((char, "\\" + char) for char in "\\_*[]()~`>#+-=|{}.!"),
+    "Markdown": tuple((char, "\\" + char) for char in "_*`["),
+}
+# Title, summary, link
+TEMPLATES = {
+    "HTML": "<b>%s</b>\n%s\n🔗 %s",
+    "MarkdownV2": "*%s*\n%s\n🔗 %s",
+    "Markdown": "*%s*\n%s\n🔗 %s",
+}
+# Visible text outside title, summary and link: two newlines, the link emoji (a surrogate pair) and a space
+TEMPLATE_UNITS = len("\n\n🔗 ".encode("utf-16-le")) // 2
+
+if MESSAGE_PARSE_MODE not in ESCAPES:
+    raise EnvironmentError(f"MESSAGE_PARSE_MODE must be one of {', '.join(ESCAPES)}, not {MESSAGE_PARSE_MODE!r}")
+
+
+def escape(text: str, parse_mode: str = MESSAGE_PARSE_MODE) -> str:
+    return _escape(text, ESCAPES[parse_mode])
+
+
+def _escape(text: str, escapes: tuple[tuple[str, str], ...]) -> str:
+    # A membership test is a C scan, so characters a text does not contain cost
+    # next to nothing; str.translate would pay a dict lookup per character
+    for char, replacement in escapes:
+        if char in text:
+            text = text.replace(char, replacement)
+    return text
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut plain text to at most `limit` characters, ending with an ellipsis when cut."""
+    if len(text) <= limit:
+        return text
+    return text[:max(0, limit - 1)].rstrip() + ELLIPSIS
+
+
+def utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, the way Telegram counts message length."""
+    # Every character is one or two units, so ASCII needs no encoding
+    return len(text) if text.isascii() else len(text.encode("utf-16-le")) // 2
+
+
+def truncate_utf16(text: str, limit: int) -> str:
+    """Cut plain text to at most `limit` UTF-16 code units, ending with an ellipsis when cut."""
+    if len(text) * 2 <= limit or utf16_len(text) <= limit:
+        return text
+    # errors="ignore" drops half a surrogate pair left at the cut
+    cut = text.encode("utf-16-le")[:max(0, limit - 1) * 2].decode("utf-16-le", errors="ignore")
+    return cut.rstrip() + ELLIPSIS
+
+
+def render_article(article: dict, parse_mode: str = MESSAGE_PARSE_MODE) -> str:
+    """
+    Message text for one article. Title and summary are cut before escaping,
+    so an escape sequence is never split, and they give way to the link so
+    the visible text, counted in UTF-16 units like Telegram does, stays
+    within its limit whatever the escaping adds.
+    """
+    escapes = ESCAPES[parse_mode]
+    link = article["link"]
+    # The link is never cut; title and then summary share what it leaves
+    room = MAX_MESSAGE_CHARS - utf16_len(link) - TEMPLATE_UNITS
+    title = truncate_utf16(truncate(article["title"], MAX_TITLE_CHARS), max(0, room))
+    room -= utf16_len(title)
+    summary = truncate_utf16(truncate(article["summary"], MAX_SUMMARY_CHARS), max(0, room))
+    return TEMPLATES[parse_mode] % (
+        _escape(title, escapes),
+        _escape(summary, escapes),
+        # Legacy Markdown has no escapes inside a bare URL; backslashes would end up in the link
+        link if parse_mode == "Markdown" else _escape(link, escapes),
+    )
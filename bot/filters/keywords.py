@@ -0,0 +1,100 @@
+# /bot/filters/keywords.py
+
+import re
+from functools import lru_cache
+
+# Keyword syntax accepted by /addfilter:
+#   python      matches anywhere in the text (case-insensitive)
+#   "python"    matches only as a whole word
+#   -python     excludes articles that contain it (can be combined: -"python")
+EXCLUDE_PREFIX = "-"
+WORD_QUOTE = '"'
+
+# Below this many substring keywords, C-level `in` checks beat the regex engine
+# (see benchmarks/bench_filters.py); above it the trie pattern wins.
+SCAN_LIMIT = 64
+
+
+def _trie_pattern(words: set[str]) -> str:
+    """
+    Build a regex that matches any of `words`, factored as a trie so the
+    regex engine walks shared prefixes once instead of trying each word.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        ends_here = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if ends_here else body
+
+    return build(trie)
+
+
+class _KeywordSet:
+    """One side (include or exclude) of a matcher, searched on case-folded text."""
+
+    def __init__(self, substrings: set[str], words: set[str]):
+        parts = []
+        self.scan: tuple[str, ...] = ()
+        if len(substrings) <= SCAN_LIMIT:
+            self.scan = tuple(sorted(substrings))
+        else:
+            parts.append(_trie_pattern(substrings))
+        if words:
+            parts.append(r"(?<!\w)(?:" + _trie_pattern(words) + r")(?!\w)")
+        self.pattern = re.compile("|".join(parts)) if parts else None
+        self.empty = not self.scan and self.pattern is None
+
+    def search(self, folded: str) -> bool:
+        for keyword in self.scan:
+            if keyword in folded:
+                return True
+        return self.pattern is not None and self.pattern.search(folded) is not None
+
+
+class KeywordMatcher:
+    """
+    A source's keyword filters, folded and compiled once. Each side (include,
+    exclude) becomes a trie-shaped regex, with small substring sets kept as a
+    plain scan because that is faster for them.
+    """
+
+    def __init__(self, keywords: tuple[str, ...]):
+        include = (set(), set())
+        exclude = (set(), set())
+        for raw in keywords:
+            keyword = raw.strip()
+            target = include
+            if keyword.startswith(EXCLUDE_PREFIX) and len(keyword) > 1:
+                keyword, target = keyword[1:].strip(), exclude
+            whole_word = len(keyword) > 2 and keyword[0] == keyword[-1] == WORD_QUOTE
+            if whole_word:
+                keyword = keyword[1:-1].strip()
+            keyword = keyword.casefold()
+            if keyword:
+                target[1 if whole_word else 0].add(keyword)
+
+        self.include = _KeywordSet(*include)
+        self.exclude = _KeywordSet(*exclude)
+
+    def matches(self, text: str) -> bool:
+        folded = text.casefold()
+        if not self.exclude.empty and self.exclude.search(folded):
+            return False
+        return self.include.empty or self.include.search(folded)
+
+
+@lru_cache(maxsize=1024)
+def compile_keywords(keywords: tuple[str, ...]) -> KeywordMatcher:
+    """Compiled matcher for a keyword set; unchanged sets are reused across routing rebuilds."""
+    return KeywordMatcher(keywords)
@@ -1,9 +1,12 @@
 # /bot/handlers/commands.py
 
+import time
 from telegram import Update
 from telegram.ext import Application, ContextTypes, CommandHandler
 from telegram.constants import ParseMode
 from bot.database import queries as db
+from bot.database import maintenance
+from bot.handlers.updates import update_queue
 from functools import partial
 
 HELP_TEXT = """
@@ -21,7 +24,7 @@ HELP_TEXT = """
 /removetarget <source_url> <chat_id> – Remove routing.
 /listtargets – List targets per source.
 
-/addfilter <source_url> <keyword> – Add a keyword filter.
+/addfilter <source_url> <keyword> – Add a keyword filter ("word" = whole word, -word = exclude).
 /removefilter <source_url> <keyword> – Remove a filter.
 /listfilters – List all filters by source.
 
@@ -215,8 +218,9 @@ async def fetch_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     await update.message.reply_text("🔄 Fetching articles now...")
     
-    from bot.scheduler.jobs import fetch_and_forward
-    await fetch_and_forward(context.bot)
+    # Joins a tick that is already running instead of fetching in parallel with it
+    from bot.scheduler.jobs import fetch_loop
+    await fetch_loop.trigger(force=True)
     
     await update.message.reply_text("✅ Fetch completed!")
 
@@ -227,10 +231,21 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, admin_
         return
 
     stats = await db.get_admin_stats()
+    updates = update_queue.stats()
+    breakers = "".join(
+        f"\n  • `{key}` – {failures} failures, retry in {max(0, int(open_until - time.time())) // 60} min"
+        for key, failures, open_until, _ in stats["open_breakers"]
+    )
     await update.message.reply_text(
         f"🛠️ *Admin Panel Stats:*\n"
         f"- 👥 Users: {stats['users']}\n"
         f"- 📚 Sources: {stats['sources']}\n"
-        f"- 🎯 Targets: {stats['targets']}",
+        f"- 🎯 Targets: {stats['targets']}\n"
+        f"- 🧭 Routing rebuilds: {stats['routing_rebuilds']}\n"
+        f"- 📮 Outbox: {stats['outbox_pending']} pending, {stats['outbox_failed']} failed\n"
+        f"- 🔌 Open breakers: {stats['breakers_open']}{breakers}\n"
+        f"- 📥 Updates: {updates['processed']} processed, {updates['duplicate']} duplicates, "
+        f"ingest p95 ≤ {updates['ingest_p95'] * 1000:g} ms\n"
+        f"- 🧹 Last compaction: {maintenance.last_report.summary() if maintenance.last_report else 'not run yet'}",
         parse_mode=ParseMode.MARKDOWN
     )
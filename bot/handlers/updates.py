@@ -0,0 +1,151 @@
+# /bot/handlers/updates.py
+
+import asyncio
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import Application
+
+from bot.metrics import registry
+from utils import get_env_variable, log_info
+
+UPDATE_WORKERS = int(get_env_variable("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_MAX = int(get_env_variable("UPDATE_QUEUE_MAX", "1000"))
+UPDATE_DEDUP_SIZE = int(get_env_variable("UPDATE_DEDUP_SIZE", "10000"))
+INGEST_SECONDS = registry.histogram("update_ingest_seconds", "Time from webhook receipt to the start of processing")
+UPDATES = registry.counter("updates_total", "Webhook updates by result", ("result",))
+UPDATE_RESULTS = ("processed", "failed", "duplicate", "rejected")
+
+
+class UpdateQueue:
+    """
+    Incoming webhook updates, processed off the HTTP request.
+
+    The webhook only validates and submits; worker tasks run the handlers.
+    Updates queue per chat and a chat is only ever handled by one worker at a
+    time, so a chat's commands run in the order Telegram sent them while
+    other chats proceed. update_ids already seen are dropped (Telegram
+    redelivers when it thinks a webhook call failed), and submit() refuses
+    new updates once UPDATE_QUEUE_MAX are waiting so Telegram backs off and
+    retries instead of us buffering without limit.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, max_pending: int = UPDATE_QUEUE_MAX,
+                 dedup_size: int = UPDATE_DEDUP_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        # Accepted updates not yet processed
+        self.depth = 0
+        self.application: Application | None = None
+        self._seen: set[int] = set()
+        self._seen_order: deque[int] = deque()
+        self._dedup_size = dedup_size
+        self._chats: dict[int, deque[tuple[Update, float]]] = {}
+        self._ready: asyncio.Queue | None = None
+        self._idle: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, application: Application):
+        if self.running:
+            return
+        self.application = application
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        log_info(f"📥 Update queue started with {self.workers} workers")
+
+    def stats(self) -> dict:
+        """Counts since start, read from the metrics registry, plus the current depth."""
+        return {
+            **{result: int(UPDATES.get(result=result)) for result in UPDATE_RESULTS},
+            "depth": self.depth,
+            "ingest_p50": INGEST_SECONDS.percentile(50),
+            "ingest_p95": INGEST_SECONDS.percentile(95),
+        }
+
+    def submit(self, update: Update) -> bool:
+        """
+        Queue an update for processing. Returns False only when the queue is
+        full (the webhook should answer with an error so Telegram retries);
+        duplicates are accepted and dropped.
+        """
+        if update.update_id in self._seen:
+            UPDATES.inc(result="duplicate")
+            return True
+        if self.depth >= self.max_pending:
+            UPDATES.inc(result="rejected")
+            return False
+
+        self._remember(update.update_id)
+        key = self._ordering_key(update)
+        pending = self._chats.get(key)
+        if pending is None:
+            pending = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        pending.append((update, time.monotonic()))
+        self.depth += 1
+        self._idle.clear()
+        return True
+
+    def _remember(self, update_id: int):
+        self._seen.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > self._dedup_size:
+            self._seen.discard(self._seen_order.popleft())
+
+    @staticmethod
+    def _ordering_key(update: Update) -> int:
+        # Updates without a chat or user have nothing to stay ordered with
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return -update.update_id
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            pending = self._chats[key]
+            update, received_at = pending.popleft()
+            INGEST_SECONDS.observe(time.monotonic() - received_at)
+            try:
+                await self.application.process_update(update)
+                UPDATES.inc(result="processed")
+            except Exception as e:
+                UPDATES.inc(result="failed")
+                log_info(f"❌ Update {update.update_id} failed: {type(e).__name__}: {e}")
+            finally:
+                self.depth -= 1
+
+            # Back of the line, so one busy chat cannot starve the others
+            if pending:
+                self._ready.put_nowait(key)
+            else:
+                del self._chats[key]
+                if self.depth == 0:
+                    self._idle.set()
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish queued updates for up to `timeout` seconds, then cancel the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            log_info(f"⚠️ Update queue stopped with {self.depth} updates pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log_info(f"📥 Update queue stopped: {self.stats()}")
+
+
+# ✅ Owned by main.run; the webhook handler only calls submit()
+update_queue = UpdateQueue()
+registry.gauge("update_queue_depth", "Acknowledged updates not yet processed", lambda: update_queue.depth)
@@ -0,0 +1,155 @@
+# /bot/metrics.py
+#
+# In-process metrics rendered in the Prometheus text format on /metrics.
+# Small on purpose: counters, gauges and histograms with optional labels,
+# no background threads and no extra dependency.
+
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# Upper bounds (seconds) used by latency histograms unless given explicitly
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "feedforwarder_"
+
+
+def _label_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name, self.description, self.labels = name, description, labels
+        self.values: dict[tuple[str, ...], float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, _label_text(self.labels, key), value
+
+
+class Gauge:
+    """Current value, either set directly or read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, fn: Callable[[], float] | None = None):
+        self.name, self.description, self.fn = name, description, fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        yield self.name, "", self.fn() if self.fn is not None else self.value
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, optionally split by labels."""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.description, self.labels, self.buckets = name, description, labels, buckets
+        # Per label set: [bucket counts..., +Inf count], sum
+        self.series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def _series(self, key: tuple[str, ...]):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        return series
+
+    def observe(self, seconds: float, **labels):
+        counts, total = self._series(tuple(labels[name] for name in self.labels))
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        total[0] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(tuple(labels[name] for name in self.labels))
+        return sum(series[0]) if series else 0
+
+    def percentile(self, pct: float, **labels) -> float:
+        """Upper bound of the bucket holding the pct-th percentile (inf if past the last bucket)."""
+        series = self.series.get(tuple(labels[name] for name in self.labels))
+        total = sum(series[0]) if series else 0
+        if not total:
+            return 0.0
+        rank = total * pct / 100
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        for key, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _label_text(self.labels, key, f'le="{_number(bound)}"'), cumulative
+            yield f"{self.name}_sum", _label_text(self.labels, key), total[0]
+            yield f"{self.name}_count", _label_text(self.labels, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def _add(self, metric):
+        # Asking twice for the same name returns the metric registered first
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(PREFIX + name, description, labels))
+
+    def gauge(self, name: str, description: str, fn: Callable[[], float] | None = None) -> Gauge:
+        return self._add(Gauge(PREFIX + name, description, fn))
+
+    def histogram(self, name: str, description: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(PREFIX + name, description, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# ✅ Process-wide registry, rendered by the /metrics route in main.py
+registry = Registry()
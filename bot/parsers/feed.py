@@ -1,92 +1,426 @@
 # /bot/parsers/feed.py
 
-import aiohttp
+import codecs
+import hashlib
+import html as html_lib
+import re
+import time
 import feedparser
+from email.utils import parsedate_to_datetime
 from bs4 import BeautifulSoup
-from utils import sanitize_text, log_info
-from urllib.parse import urljoin
+from utils import log_info, get_env_variable
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from bot.parsers.http import http_client
+from bot.parsers.pool import HTML_PARSER, parser_pool
+from bot.parsers.html_meta import extract_metadata
+from bot.metrics import registry
+from bot.database.queries import (
+    get_validators,
+    save_validators,
+    get_feed_digests,
+    save_feed_digests,
+    get_discovered_feed,
+    save_discovered_feed,
+    forget_discovered_feed,
+)
 
 HEADERS = {"User-Agent": "Mozilla/5.0 FeedForwarderBot/1.0"}
+DISCOVERY_TTL_HOURS = int(get_env_variable("DISCOVERY_TTL_HOURS", "24"))
+DISCOVERY_NEGATIVE_TTL_HOURS = int(get_env_variable("DISCOVERY_NEGATIVE_TTL_HOURS", "6"))
+FEED_MAX_BYTES = int(get_env_variable("FEED_MAX_BYTES", str(5 * 1024 * 1024)))
+HTML_MAX_BYTES = int(get_env_variable("HTML_MAX_BYTES", str(1024 * 1024)))
+CHUNK_BYTES = 64 * 1024
+MAX_ENTRIES = 5
+# "stream": event-based extractor that stops early; "soup": full BeautifulSoup tree
+HTML_EXTRACTOR = get_env_variable("HTML_EXTRACTOR", "stream")
+
+# Closing tag of an RSS <item> or Atom <entry>, with or without a namespace prefix
+ENTRY_END = re.compile(rb"</(?:[\w-]+:)?(?:item|entry)\s*>", re.IGNORECASE)
+ENTRY_END_OVERLAP = 64
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "dclid", "mc_cid", "mc_eid", "_hsenc", "_hsmi", "igshid")
+
+# Entry boundaries and identifiers, scanned without parsing the XML
+ENTRY_START = re.compile(rb"<(?:[\w-]+:)?(?:item|entry)[\s>]", re.IGNORECASE)
+ENTRY_ID = re.compile(rb"<(?:[\w-]+:)?(?:guid|id)\b[^>]*>\s*([^<]+?)\s*<", re.IGNORECASE)
+ENTRY_LINK = re.compile(rb"<link\b[^>]*?href=[\"']([^\"']+)|<link>\s*([^<]+?)\s*<", re.IGNORECASE)
+
+# RSS 2.0 <ttl>: minutes the channel may be cached before refreshing
+RSS_TTL = re.compile(rb"<ttl>\s*(\d+)\s*</ttl>", re.IGNORECASE)
+MAX_AGE = re.compile(r"(?:^|,)\s*max-age\s*=\s*\"?(\d+)", re.IGNORECASE)
+MARKUP_TAG = re.compile(r"<[^>]*>")
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">,
+# looked for in the first bytes of a page as browsers do
+META_CHARSET = re.compile(rb"""<meta\b[^>]*?charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+META_CHARSET_BYTES = 1024
+# Content types whose text may carry markup; anything else is already plain text
+MARKUP_TYPES = ("text/html", "application/xhtml+xml")
+
+PARSE_SECONDS = registry.histogram("parse_seconds", "Time to parse one document, including pool wait", ("kind",))
+
+# ✅ Seconds each fetched URL asked us to wait before polling again
+# (Cache-Control max-age, Expires or RSS <ttl>); read by the poll scheduler
+poll_hints: dict[str, int] = {}
+# ✅ Validators and digests of parsed feeds by source URL, waiting for save_feed_state
+pending_state: dict[str, tuple] = {}
+
+def plain_text(value: str, content_type: str = "text/html") -> str:
+    """
+    Feed titles and summaries as plain text: markup dropped (only when the
+    content type says it is markup, so "List<T>" survives), entities decoded,
+    whitespace collapsed. Escaping for Telegram happens once, at render time.
+    """
+    if not value:
+        return ""
+    if content_type in MARKUP_TYPES:
+        value = MARKUP_TAG.sub(" ", value)
+    return " ".join(html_lib.unescape(value).split())
+
+def entry_text(entry, key: str, fallback: str = "") -> str:
+    """plain_text of a feedparser entry field, using the type feedparser detected for it."""
+    detail = entry.get(f"{key}_detail") or {}
+    return plain_text(entry.get(key, fallback), detail.get("type", "text/html"))
+
+def canonical_feed_url(url: str) -> str:
+    """
+    Normalise the parts of a feed URL that never change what is served:
+    scheme/host case, default ports and the fragment.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    if "@" in parts.netloc:
+        host = f"{parts.netloc.rsplit('@', 1)[0]}@{host}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+def canonical_article_url(link: str) -> str:
+    """
+    Normalise an article link for dedup: drop the scheme (http and https are
+    the same article), tracking parameters, the fragment and a trailing slash.
+    """
+    parts = urlsplit(link.strip())
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ]
+    return urlunsplit(("", host, parts.path.rstrip("/") or "/", urlencode(query), ""))
+
+def article_identity(entry_id: str | None, link: str) -> str:
+    """
+    Stable dedup key for an article: the entry's guid/id when the feed has
+    one, otherwise its canonical link. URL-shaped IDs are canonicalised too.
+    """
+    entry_id = (entry_id or "").strip()
+    if not entry_id:
+        return f"url:{canonical_article_url(link)}"
+    if entry_id.startswith(("http://", "https://")):
+        return f"id:{canonical_article_url(entry_id)}"
+    return f"id:{entry_id}"
+
+async def read_body(response, url: str, max_bytes: int, max_entries: int | None = None) -> bytes:
+    """
+    Stream a response body instead of buffering it whole. Stops at max_bytes,
+    or right after the closing tag of the max_entries-th feed entry.
+    """
+    body = bytearray()
+    entries = 0
+    scan_from = 0
+    async for chunk in response.content.iter_chunked(CHUNK_BYTES):
+        body += chunk
+        if max_entries:
+            for match in ENTRY_END.finditer(body, scan_from):
+                entries += 1
+                scan_from = match.end()
+                if entries >= max_entries:
+                    return bytes(body[:match.end()])
+            # Rescan the tail next time in case a closing tag was split across chunks
+            scan_from = max(scan_from, len(body) - ENTRY_END_OVERLAP)
+        if len(body) >= max_bytes:
+            log_info(f"✂️ {url} is over {max_bytes} bytes, truncating")
+            return bytes(body[:max_bytes])
+    return bytes(body)
+
+def freshness_seconds(headers) -> int | None:
+    """How long a response says it stays fresh, from Cache-Control or Expires."""
+    cache_control = headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return None
+    match = MAX_AGE.search(cache_control)
+    if match:
+        return int(match.group(1))
+    try:
+        expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+        now = parsedate_to_datetime(headers["Date"]).timestamp() if "Date" in headers else time.time()
+    except (KeyError, TypeError, ValueError):
+        return None
+    return max(0, int(expires - now))
+
+def remember_hint(url: str, seconds: int | None):
+    if seconds:
+        poll_hints[url] = max(seconds, poll_hints.get(url, 0))
+
+def html_encoding(body: bytes, declared: str | None) -> str:
+    """
+    Encoding of an HTML page: the Content-Type charset, else the page's own
+    <meta charset> declaration, else UTF-8. Unknown names are skipped.
+    """
+    match = META_CHARSET.search(body, 0, META_CHARSET_BYTES)
+    for candidate in (declared, match and match.group(1).decode("ascii")):
+        if candidate:
+            try:
+                return codecs.lookup(candidate).name
+            except LookupError:
+                continue
+    return "utf-8"
 
 async def fetch_url(session, url: str) -> str:
     async with session.get(url, headers=HEADERS, timeout=10) as response:
-        return await response.text()
-
-async def parse_rss(url: str) -> list[dict]:
-    async with aiohttp.ClientSession() as session:
-        content = await fetch_url(session, url)
-        feed = feedparser.parse(content)
-        return [
-            {
-                "title": sanitize_text(entry.title),
-                "link": entry.link,
-                "summary": sanitize_text(entry.get("summary", entry.get("description", ""))),
-            }
-            for entry in feed.entries[:5]
+        remember_hint(url, freshness_seconds(response.headers))
+        response.raise_for_status()
+        body = await read_body(response, url, HTML_MAX_BYTES)
+        return body.decode(html_encoding(body, response.charset), errors="replace")
+
+class NotModified(Exception):
+    """Raised when a conditional GET comes back 304 and there is nothing to parse."""
+
+class ContentUnchanged(NotModified):
+    """
+    Raised when a feed answered 200 but its body (reason "body") or its set
+    of entry IDs (reason "ids") is the same as last time.
+    """
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(url)
+        self.reason = reason
+
+def body_digest(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+def entry_ids_digest(content: bytes) -> str | None:
+    """
+    Digest of the guid/id (or link) of every entry, found with a regex scan
+    instead of a full parse. None when no entry IDs could be found.
+    """
+    starts = [match.start() for match in ENTRY_START.finditer(content)]
+    ids = []
+    for start, end in zip(starts, starts[1:] + [len(content)]):
+        entry = content[start:end]
+        match = ENTRY_ID.search(entry) or ENTRY_LINK.search(entry)
+        if match is None:
+            return None
+        ids.append(next(group for group in match.groups() if group))
+    if not ids:
+        return None
+    return hashlib.blake2b(b"\n".join(sorted(ids)), digest_size=16).hexdigest()
+
+async def fetch_conditional(session, url: str, etag: str | None,
+                            last_modified: str | None) -> tuple[bytes, str | None, str | None]:
+    """
+    GET with If-None-Match / If-Modified-Since built from the given validators.
+    Returns (raw body, etag, last_modified) or raises NotModified on 304.
+    Only the first MAX_ENTRIES entries are downloaded.
+    """
+    headers = dict(HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with session.get(url, headers=headers, timeout=10) as response:
+        remember_hint(url, freshness_seconds(response.headers))
+        if response.status == 304:
+            raise NotModified(url)
+        response.raise_for_status()
+        body = await read_body(response, url, FEED_MAX_BYTES, MAX_ENTRIES)
+        if response.status != 200:
+            return body, etag, last_modified
+        return body, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+# -- Pure parse functions (run in the parser pool, so they must stay picklable) --
+
+def parse_feed_document(content: bytes) -> list[dict]:
+    # feedparser reads the XML encoding declaration itself, so hand it raw bytes
+    feed = feedparser.parse(content)
+    return [
+        {
+            "id": article_identity(entry.get("id"), entry.link),
+            "title": entry_text(entry, "title"),
+            "link": entry.link,
+            "summary": entry_text(entry, "summary", entry.get("description", "")),
+        }
+        for entry in feed.entries[:MAX_ENTRIES]
+    ]
+
+def parse_html_document(html: str, url: str) -> dict:
+    if HTML_EXTRACTOR == "soup":
+        return parse_html_document_soup(html, url)
+
+    meta = extract_metadata(html)
+    title = meta["title"].strip() if meta["title"] else "No Title"
+    return {
+        "id": article_identity(None, url),
+        "title": plain_text(title, "text/plain"),
+        "summary": plain_text(meta["description"] or meta["paragraph"], "text/plain"),
+        "image": meta["image"],
+        "link": url,
+    }
+
+def parse_html_document_soup(html: str, url: str) -> dict:
+    soup = BeautifulSoup(html, HTML_PARSER)
+    title = soup.title.string.strip() if soup.title else "No Title"
+    summary = ""
+
+    # Try to get meta description first
+    meta_desc = soup.find("meta", attrs={"name": "description"})
+    if meta_desc and meta_desc.get("content"):
+        summary = meta_desc["content"]
+    else:
+        # Fall back to first paragraph
+        for tag in soup.find_all("p"):
+            text = tag.get_text(strip=True)
+            if len(text) > 60:
+                summary = text
+                break
+
+    image = ""
+    og_img = soup.find("meta", property="og:image")
+    if og_img and og_img.get("content"):
+        image = og_img["content"]
+
+    return {
+        "id": article_identity(None, url),
+        "title": plain_text(title, "text/plain"),
+        "summary": plain_text(summary, "text/plain"),
+        "image": image,
+        "link": url,
+    }
+
+def find_feed_link(html: str, url: str) -> str | None:
+    if HTML_EXTRACTOR == "soup":
+        soup = BeautifulSoup(html, HTML_PARSER)
+
+        # Find embedded RSS feed links
+        rss_links = [
+            link.get("href")
+            for link in soup.find_all("link", type="application/rss+xml")
+            if link.get("href")
         ]
+        rss_url = rss_links[0] if rss_links else None
+    else:
+        rss_url = extract_metadata(html, head_only=True)["feed_href"]
 
-async def parse_html(url: str) -> dict:
-    async with aiohttp.ClientSession() as session:
+    if not rss_url:
+        return None
+    if not rss_url.startswith("http"):
+        rss_url = urljoin(url, rss_url)
+    return rss_url
+
+# -- Fetch + parse --
+
+async def parse_rss(url: str, source_url: str | None = None) -> list[dict]:
+    """
+    Fetch and parse the feed at `url` for `source_url`, the URL the scheduler
+    fetched (the page a feed was discovered on, or the feed itself).
+    Validators and digests are kept per source URL, so two pages that lead to
+    the same feed each see its new entries. They are not saved here:
+    parse_rss leaves them in pending_state for save_feed_state, which the
+    scheduler calls once the articles are queued.
+    """
+    source_url = source_url or url
+    key = canonical_feed_url(source_url)
+    session = await http_client.get_session()
+    stored = await get_validators(key)
+    content, etag, last_modified = await fetch_conditional(session, url, *stored)
+    ttl = RSS_TTL.search(content)
+    if ttl:
+        remember_hint(url, int(ttl.group(1)) * 60)
+
+    # ✅ Skip parsing when the body, or at least its set of entries, has not changed.
+    # There is nothing to forward then, so the fresh validators are saved right away
+    # (otherwise a feed that only bumped lastBuildDate would never answer 304 again).
+    digests = (body_digest(content), entry_ids_digest(content))
+    stored_digests = await get_feed_digests(key)
+    unchanged = None
+    if digests[0] == stored_digests[0]:
+        unchanged = "body"
+    elif digests[1] is not None and digests[1] == stored_digests[1]:
+        unchanged = "ids"
+        await save_feed_digests(key, *digests)
+    if unchanged:
+        if (etag, last_modified) != stored:
+            await save_validators(key, etag, last_modified)
+        raise ContentUnchanged(url, unchanged)
+
+    with PARSE_SECONDS.time(kind="feed"):
+        articles = await parser_pool.run(parse_feed_document, content, size=len(content))
+
+    pending_state[source_url] = (key, stored, (etag, last_modified), digests)
+    return articles
+
+async def save_feed_state(source_url: str):
+    """
+    Save the validators and digests parse_rss held back for a source. Until
+    then a failed tick leaves the feed looking changed, so the next tick
+    parses it again instead of skipping articles that were never queued.
+    """
+    state = pending_state.pop(source_url, None)
+    if state is None:
+        return
+    key, stored, validators, digests = state
+    if validators != stored:
+        await save_validators(key, *validators)
+    await save_feed_digests(key, *digests)
+
+async def parse_html(url: str, html: str | None = None) -> dict:
+    if html is None:
+        session = await http_client.get_session()
         html = await fetch_url(session, url)
-        soup = BeautifulSoup(html, "html.parser")
-        title = soup.title.string.strip() if soup.title else "No Title"
-        summary = ""
-
-        # Try to get meta description first
-        meta_desc = soup.find("meta", attrs={"name": "description"})
-        if meta_desc and meta_desc.get("content"):
-            summary = meta_desc["content"]
-        else:
-            # Fall back to first paragraph
-            for tag in soup.find_all("p"):
-                text = tag.get_text(strip=True)
-                if len(text) > 60:
-                    summary = text
-                    break
-
-        image = ""
-        og_img = soup.find("meta", property="og:image")
-        if og_img and og_img.get("content"):
-            image = og_img["content"]
-
-        return {
-            "title": sanitize_text(title),
-            "summary": sanitize_text(summary),
-            "image": image,
-            "link": url,
-        }
+    with PARSE_SECONDS.time(kind="html"):
+        return await parser_pool.run(parse_html_document, html, url, size=len(html))
+
+async def discover_feed(url: str) -> tuple[str | None, str]:
+    """Download an HTML page and return (feed_url or None, html)."""
+    session = await http_client.get_session()
+    html = await fetch_url(session, url)
+    with PARSE_SECONDS.time(kind="discovery"):
+        return await parser_pool.run(find_feed_link, html, url, size=len(html)), html
 
 async def fetch_articles(url: str) -> list[dict]:
     """
     Fetch articles from RSS feeds or HTML pages.
-    Returns list of articles with title, summary, and link.
+    Returns list of articles with id, title, summary, and link.
+    Raises NotModified when the feed answered 304 to a conditional GET, and
+    lets fetch/parse errors through so the engine can track failing sources.
     """
-    try:
-        if url.endswith(('.rss', '.xml')) or 'rss' in url.lower() or 'feed' in url.lower():
-            return await parse_rss(url)
-
-        # Try to discover RSS feeds from HTML
-        async with aiohttp.ClientSession() as session:
-            html = await fetch_url(session, url)
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # Find embedded RSS feed links
-            rss_links = [
-                link.get("href")
-                for link in soup.find_all("link", type="application/rss+xml")
-                if link.get("href")
-            ]
-
-            if rss_links:
-                rss_url = rss_links[0]
-                if not rss_url.startswith("http"):
-                    rss_url = urljoin(url, rss_url)
-                return await parse_rss(rss_url)
-
-        # Fallback: treat as article
-        article = await parse_html(url)
-        return [article] if article['title'] != 'No Title' else []
-
-    except Exception as e:
-        log_info(f"Error fetching articles from {url}: {e}")
-        return []
+    if url.endswith(('.rss', '.xml')) or 'rss' in url.lower() or 'feed' in url.lower():
+        return await parse_rss(url)
+
+    # Use the cached discovery result when it is still fresh
+    hit, feed_url = await get_discovered_feed(url, DISCOVERY_TTL_HOURS, DISCOVERY_NEGATIVE_TTL_HOURS)
+    html = None
+    if not hit:
+        feed_url, html = await discover_feed(url)
+        await save_discovered_feed(url, feed_url)
+
+    if feed_url:
+        try:
+            return await parse_rss(feed_url, url)
+        except NotModified:
+            raise
+        except Exception:
+            # Feed moved or broke, so look again next time
+            await forget_discovered_feed(url)
+            raise
+        finally:
+            # The scheduler knows the page URL, not the discovered feed
+            remember_hint(url, poll_hints.pop(feed_url, None))
+
+    # Fallback: treat as article
+    article = await parse_html(url, html)
+    return [article] if article['title'] != 'No Title' else []
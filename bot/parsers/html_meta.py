@@ -0,0 +1,102 @@
+# /bot/parsers/html_meta.py
+
+from html.parser import HTMLParser
+
+MIN_PARAGRAPH_CHARS = 60
+FEED_LINK_TYPE = "application/rss+xml"
+
+
+class _Done(Exception):
+    """Raised from a handler to stop parsing once everything needed was seen."""
+
+
+class _MetaParser(HTMLParser):
+    """
+    Event-based scan for the handful of fields parse_html needs. Unlike a
+    BeautifulSoup tree, nothing is kept except those fields, and parsing stops
+    at </head> (or the first long <p> when there is no meta description).
+    """
+
+    def __init__(self, head_only: bool):
+        super().__init__(convert_charrefs=True)
+        self.head_only = head_only
+        self.title: str | None = None
+        self.description: str | None = None
+        self.image: str | None = None
+        self.feed_href: str | None = None
+        self.paragraph = ""
+        self._in_title = False
+        self._title_parts: list[str] = []
+        self._p_depth = 0
+        self._p_parts: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "meta":
+            # Like soup.find(), only the first matching tag counts, even if it has no content
+            attrs = dict(attrs)
+            if attrs.get("name") == "description" and self.description is None:
+                self.description = attrs.get("content") or ""
+            elif attrs.get("property") == "og:image" and self.image is None:
+                self.image = attrs.get("content") or ""
+        elif tag == "link":
+            attrs = dict(attrs)
+            if self.feed_href is None and attrs.get("type") == FEED_LINK_TYPE and attrs.get("href"):
+                self.feed_href = attrs["href"]
+        elif tag == "p":
+            if self._p_depth == 0:
+                self._p_parts = []
+            self._p_depth += 1
+        elif tag == "body":
+            self._end_of_head()
+
+    def handle_startendtag(self, tag, attrs):
+        # <meta ... /> and <link ... /> must not open a <p> or a title
+        if tag in ("meta", "link"):
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts)
+        elif tag == "p" and self._p_depth:
+            self._p_depth -= 1
+            if self._p_depth == 0:
+                text = "".join(part.strip() for part in self._p_parts)
+                if len(text) > MIN_PARAGRAPH_CHARS:
+                    self.paragraph = text
+                    raise _Done
+        elif tag == "head":
+            self._end_of_head()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+        elif self._p_depth:
+            self._p_parts.append(data)
+
+    def _end_of_head(self):
+        if self.head_only or self.description:
+            raise _Done
+
+
+def extract_metadata(html: str, head_only: bool = False) -> dict:
+    """
+    Return title, description, image, feed_href and (when there is no meta
+    description) the first paragraph longer than MIN_PARAGRAPH_CHARS.
+    With head_only=True, stop at the end of <head> (enough for feed discovery).
+    """
+    parser = _MetaParser(head_only)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Done:
+        pass
+    return {
+        "title": parser.title,
+        "description": parser.description or "",
+        "image": parser.image or "",
+        "feed_href": parser.feed_href,
+        "paragraph": parser.paragraph,
+    }
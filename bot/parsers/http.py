@@ -0,0 +1,81 @@
+# /bot/parsers/http.py
+
+import aiohttp
+from bot.metrics import registry
+from utils import get_env_variable, log_info
+
+HTTP_POOL_LIMIT = int(get_env_variable("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_PER_HOST = int(get_env_variable("HTTP_POOL_PER_HOST", "4"))
+HTTP_DNS_TTL = int(get_env_variable("HTTP_DNS_TTL", "300"))
+HTTP_KEEPALIVE = float(get_env_variable("HTTP_KEEPALIVE", "60"))
+
+# Fed by aiohttp tracing, to confirm pooled connections and the DNS cache are reused
+REQUESTS = registry.counter("http_requests_total", "Outgoing HTTP requests")
+CONNECTIONS = registry.counter("http_connections_total", "Connections used by outgoing requests, new or reused", ("kind",))
+DNS_CACHE = registry.counter("http_dns_cache_total", "Host lookups by whether the DNS cache answered", ("result",))
+
+
+class HttpClient:
+    """
+    One long-lived aiohttp session owned by the application.
+    The session is created lazily on first use and closed from main.run.
+    """
+
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_POOL_PER_HOST,
+                 dns_ttl: int = HTTP_DNS_TTL, keepalive: float = HTTP_KEEPALIVE):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self._session: aiohttp.ClientSession | None = None
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            REQUESTS.inc()
+
+        async def on_connection_create_end(session, ctx, params):
+            CONNECTIONS.inc(kind="created")
+
+        async def on_connection_reuseconn(session, ctx, params):
+            CONNECTIONS.inc(kind="reused")
+
+        async def on_dns_cache_hit(session, ctx, params):
+            DNS_CACHE.inc(result="hit")
+
+        async def on_dns_cache_miss(session, ctx, params):
+            DNS_CACHE.inc(result="miss")
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            log_info(f"🔌 HTTP client closed after {REQUESTS.get():g} requests, "
+                     f"{CONNECTIONS.get(kind='created'):g} connections created, {CONNECTIONS.get(kind='reused'):g} reused")
+        self._session = None
+
+
+# ✅ Shared by every fetch in the process
+http_client = HttpClient()
@@ -0,0 +1,77 @@
+# /bot/parsers/pool.py
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from bot.metrics import registry
+from utils import get_env_variable, log_info
+
+# thread: keeps the event loop responsive while parsing (default)
+# process: true parallelism for CPU-bound parsing, at the cost of pickling results
+# inline: parse on the event loop, as before
+PARSER_POOL = get_env_variable("PARSER_POOL", "thread")
+PARSER_WORKERS = int(get_env_variable("PARSER_WORKERS", "2"))
+PARSER_MAX_PENDING = int(get_env_variable("PARSER_MAX_PENDING", "32"))
+PARSER_INLINE_BYTES = int(get_env_variable("PARSER_INLINE_BYTES", "16384"))
+
+# ✅ Optional faster HTML backend
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = get_env_variable("HTML_PARSER", "lxml")
+except ImportError:
+    HTML_PARSER = get_env_variable("HTML_PARSER", "html.parser")
+
+
+class ParserPool:
+    """
+    Runs CPU-heavy parse functions off the event loop. Small documents are
+    parsed inline because the hand-off would cost more than the parse, and a
+    semaphore bounds how many jobs can be queued at once.
+    """
+
+    def __init__(self, kind: str = PARSER_POOL, workers: int = PARSER_WORKERS,
+                 max_pending: int = PARSER_MAX_PENDING, inline_bytes: int = PARSER_INLINE_BYTES):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.inline_bytes = inline_bytes
+        self._executor: Executor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self.in_flight = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn, not fork: forked workers would inherit open sockets and the SQLite handle
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parser")
+            log_info(f"🧵 Parser pool started ({self.kind}, {self.workers} workers, HTML parser {HTML_PARSER})")
+        return self._executor
+
+    async def run(self, fn, *args, size: int = 0):
+        """Call fn(*args) in the pool; `size` is the document size used for the inline shortcut."""
+        if self.kind == "inline" or size < self.inline_bytes:
+            return fn(*args)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        self.in_flight += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# ✅ Shared by the parser module; closed from main.run
+parser_pool = ParserPool()
+registry.gauge("parser_in_flight", "Parse jobs queued for or running in the pool", lambda: parser_pool.in_flight)
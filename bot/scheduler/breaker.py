@@ -0,0 +1,126 @@
+# /bot/scheduler/breaker.py
+
+import asyncio
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from bot.database.queries import load_breakers, save_breakers
+from bot.parsers.feed import canonical_feed_url
+from utils import get_env_variable, log_info
+
+BREAKER_THRESHOLD = int(get_env_variable("BREAKER_THRESHOLD", "3"))
+BREAKER_BASE_SECONDS = int(get_env_variable("BREAKER_BASE_SECONDS", "300"))
+BREAKER_MAX_SECONDS = int(get_env_variable("BREAKER_MAX_SECONDS", str(6 * 3600)))
+
+# Errors that say the host itself is unreachable, not just one feed on it
+HOST_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+@dataclass
+class BreakerState:
+    """Consecutive failures for one source or host, and when it may be tried again."""
+    failures: int = 0
+    open_until: float = 0.0
+    last_error: str = ""
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures per source ("source:<url>") and per host
+    ("host:<name>"). After BREAKER_THRESHOLD failures the breaker opens and the
+    key is skipped for an exponentially growing period; once that passes, a
+    single half-open probe is let through and either closes it or reopens it
+    for longer. State is loaded from and saved to the `breakers` table.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, base: int = BREAKER_BASE_SECONDS,
+                 maximum: int = BREAKER_MAX_SECONDS):
+        self.threshold = threshold
+        self.base = base
+        self.maximum = maximum
+        self._states: dict[str, BreakerState] | None = None
+        self._probing: set[str] = set()
+        self._dirty: set[str] = set()
+
+    @staticmethod
+    def keys(url: str) -> tuple[str, str]:
+        canonical = canonical_feed_url(url)
+        return f"source:{canonical}", f"host:{urlsplit(canonical).netloc}"
+
+    async def load(self):
+        if self._states is None:
+            self._states = {
+                key: BreakerState(failures, open_until, last_error or "")
+                for key, failures, open_until, last_error in await load_breakers()
+            }
+
+    def allow(self, url: str) -> bool:
+        """False while the source or its host is open; claims the half-open probe otherwise."""
+        now = time.time()
+        claimed = []
+        for key in self.keys(url):
+            state = self._states.get(key)
+            if state is None or state.failures < self.threshold:
+                continue
+            if state.open_until > now or key in self._probing:
+                self._probing.difference_update(claimed)
+                return False
+            claimed.append(key)
+        self._probing.update(claimed)
+        return True
+
+    def release(self, url: str):
+        """Give back a probe claimed by allow() without recording a result (e.g. on cancel)."""
+        self._probing.difference_update(self.keys(url))
+
+    def record_success(self, url: str):
+        for key in self.keys(url):
+            self._close(key)
+
+    def _close(self, key: str):
+        self._probing.discard(key)
+        if self._states.pop(key, None) is not None:
+            self._dirty.add(key)
+
+    def record_failure(self, url: str, error: BaseException):
+        source_key, host_key = self.keys(url)
+        if isinstance(error, HOST_ERRORS):
+            keys = [source_key, host_key]
+        else:
+            # The host answered, which is a success for it (and closes it if this was its half-open probe)
+            keys = [source_key]
+            self._close(host_key)
+        now = time.time()
+        for key in keys:
+            self._probing.discard(key)
+            state = self._states.setdefault(key, BreakerState())
+            state.last_error = f"{type(error).__name__}: {error}"[:200]
+            self._dirty.add(key)
+            # Feeds already in flight when the breaker opened must not stretch the backoff
+            if state.open_until > now:
+                continue
+            state.failures += 1
+            if state.failures >= self.threshold:
+                backoff = min(self.maximum, self.base * 2 ** (state.failures - self.threshold))
+                state.open_until = now + backoff
+                log_info(f"🔌 Breaker open for {key} for {backoff}s after {state.failures} failures")
+
+    async def save(self):
+        """Write the keys that changed since the last save."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        await save_breakers(
+            [
+                (key, state.failures, state.open_until, state.last_error)
+                for key in dirty if (state := self._states.get(key)) is not None
+            ],
+            [key for key in dirty if key not in self._states],
+        )
+
+
+# ✅ Shared by the fetch engine; state survives restarts through the database
+breaker = CircuitBreaker()
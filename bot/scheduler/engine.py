@@ -0,0 +1,141 @@
+# /bot/scheduler/engine.py
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from bot.parsers.feed import ContentUnchanged, NotModified, fetch_articles
+from bot.scheduler.breaker import CircuitBreaker, breaker as shared_breaker
+from bot.metrics import registry
+from utils import get_env_variable, log_info
+
+MAX_CONCURRENT_FETCHES = int(get_env_variable("FETCH_CONCURRENCY", "20"))
+MAX_FETCHES_PER_HOST = int(get_env_variable("FETCH_PER_HOST", "2"))
+
+FETCH_SECONDS = registry.histogram("fetch_seconds", "Time to fetch (and parse) one source")
+FETCHES = registry.counter("fetches_total", "Source fetches by outcome", ("outcome",))
+
+
+@dataclass
+class TickStats:
+    """Timing numbers for one batch of fetches."""
+    sources: int = 0
+    errors: int = 0
+    not_modified: int = 0
+    same_body: int = 0
+    same_ids: int = 0
+    skipped: int = 0
+    # Due feeds another worker process held a lease on
+    leased: int = 0
+    wall_seconds: float = 0.0
+    fetch_seconds: float = 0.0
+    slowest_url: str = ""
+    slowest_seconds: float = 0.0
+    per_host: dict[str, float] = field(default_factory=dict)
+
+    def record(self, url: str, seconds: float):
+        self.fetch_seconds += seconds
+        host = urlsplit(url).hostname or ""
+        self.per_host[host] = self.per_host.get(host, 0.0) + seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_url, self.slowest_seconds = url, seconds
+
+    def merge(self, other: "TickStats"):
+        """Fold in the stats of a batch that ran alongside this one (another shard)."""
+        for name in ("sources", "errors", "not_modified", "same_body", "same_ids", "skipped", "leased"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.wall_seconds = max(self.wall_seconds, other.wall_seconds)
+        self.fetch_seconds += other.fetch_seconds
+        for host, seconds in other.per_host.items():
+            self.per_host[host] = self.per_host.get(host, 0.0) + seconds
+        if other.slowest_seconds > self.slowest_seconds:
+            self.slowest_url, self.slowest_seconds = other.slowest_url, other.slowest_seconds
+
+    @property
+    def unchanged(self) -> int:
+        """Sources that were fetched but never reached the parser."""
+        return self.not_modified + self.same_body + self.same_ids
+
+    def summary(self) -> str:
+        return (
+            f"{self.sources} sources in {self.wall_seconds:.2f}s "
+            f"(serial {self.fetch_seconds:.2f}s, slowest {self.slowest_seconds:.2f}s "
+            f"{self.slowest_url}, unchanged {self.unchanged} (304 {self.not_modified}, "
+            f"same body {self.same_body}, same entries {self.same_ids}), "
+            f"errors {self.errors}, skipped {self.skipped}, leased elsewhere {self.leased})"
+        )
+
+
+class FetchEngine:
+    """
+    Runs source fetches concurrently with a global cap and a per-host cap,
+    so one tick takes about as long as the slowest host instead of the sum.
+    Sources or hosts with an open circuit breaker are skipped before they
+    take a slot.
+    """
+
+    def __init__(self, fetch=fetch_articles, max_concurrent: int = MAX_CONCURRENT_FETCHES,
+                 max_per_host: int = MAX_FETCHES_PER_HOST, breaker: CircuitBreaker = shared_breaker):
+        self.fetch = fetch
+        self.max_concurrent = max_concurrent
+        self.max_per_host = max_per_host
+        self.breaker = breaker
+
+    async def fetch_all(self, urls: list[str]) -> tuple[list[list[dict]], TickStats]:
+        """Fetch every URL and return the results in input order, plus timing stats."""
+        stats = TickStats(sources=len(urls))
+        global_slots = asyncio.Semaphore(self.max_concurrent)
+        host_slots: dict[str, asyncio.Semaphore] = {}
+        await self.breaker.load()
+
+        async def run_one(url: str) -> list[dict]:
+            if not self.breaker.allow(url):
+                stats.skipped += 1
+                FETCHES.inc(outcome="skipped")
+                return []
+            try:
+                return await fetch_one(url)
+            finally:
+                self.breaker.release(url)
+
+        async def fetch_one(url: str) -> list[dict]:
+            host = urlsplit(url).hostname or ""
+            if host not in host_slots:
+                host_slots[host] = asyncio.Semaphore(self.max_per_host)
+            async with host_slots[host], global_slots:
+                started = time.perf_counter()
+                try:
+                    articles = await self.fetch(url)
+                except ContentUnchanged as e:
+                    if e.reason == "body":
+                        stats.same_body += 1
+                    else:
+                        stats.same_ids += 1
+                    FETCHES.inc(outcome=f"same_{e.reason}")
+                    self.breaker.record_success(url)
+                    return []
+                except NotModified:
+                    stats.not_modified += 1
+                    FETCHES.inc(outcome="not_modified")
+                    self.breaker.record_success(url)
+                    return []
+                except Exception as e:
+                    stats.errors += 1
+                    FETCHES.inc(outcome="error")
+                    self.breaker.record_failure(url, e)
+                    log_info(f"❌ Fetch failed for {url}: {type(e).__name__}: {e}")
+                    return []
+                finally:
+                    seconds = time.perf_counter() - started
+                    stats.record(url, seconds)
+                    FETCH_SECONDS.observe(seconds)
+                FETCHES.inc(outcome="ok")
+                self.breaker.record_success(url)
+                return articles
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(run_one(url) for url in urls))
+        stats.wall_seconds = time.perf_counter() - started
+        await self.breaker.save()
+        return list(results), stats
@@ -1,69 +1,238 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import os
+import socket
+import time
 from telegram import Bot
-from bot.parsers.feed import fetch_articles
+from bot.scheduler.engine import FetchEngine, TickStats
+from bot.scheduler.loop import PeriodicTask
+from bot.scheduler.polling import PollPolicy
+from bot.scheduler.shards import shards
+from bot.parsers.feed import canonical_feed_url, pending_state, poll_hints, save_feed_state
 from bot.database.queries import (
-    get_sources,
-    get_filters_by_source,
-    get_targets_by_source,
-    is_article_sent,
-    mark_article_sent,
-    get_or_create_user,
+    get_unsent_ids,
+    queue_articles,
+    get_feed_schedule,
+    save_feed_schedule,
+    acquire_leases,
+    release_leases,
+    get_lease_owners,
+    release_owner_leases,
 )
-from utils import log_info
-from aiosqlite import connect
+from bot.database.routing import RoutingSnapshot, routing
+from bot.database.maintenance import MAINTENANCE_CHECK_SECONDS, compact_if_due
+from bot.delivery.queue import delivery
+from bot.delivery.render import MESSAGE_PARSE_MODE, render_article
+from bot.metrics import registry
+from utils import get_env_variable, log_info
 
-FETCH_INTERVAL_MIN = 5
+# How often the scheduler wakes up to look for feeds that are due
+POLL_TICK_SECONDS = int(get_env_variable("POLL_TICK_SECONDS", "30"))
+# A lease outlives a crashed fetcher by this long before another process may take the feed
+FETCH_LEASE_SECONDS = int(get_env_variable("FETCH_LEASE_SECONDS", "900"))
+# Unique per process, so every fetch worker holds its own leases
+LEASE_HOST = socket.gethostname()
+LEASE_OWNER = f"{LEASE_HOST}:{os.getpid()}"
 
-# ✅ Make scheduler global so it can be shutdown gracefully
-scheduler = AsyncIOScheduler()
+# ✅ Global loops so /fetchnow can trigger them and main.run can stop them
+fetch_loop = PeriodicTask("Fetch", POLL_TICK_SECONDS)
+maintenance_loop = PeriodicTask("Maintenance", MAINTENANCE_CHECK_SECONDS)
+engine = FetchEngine()
+policy = PollPolicy()
+
+TICKS = registry.counter("ticks_total", "Scheduler ticks, by whether any feed was due", ("result",))
+TICK_SECONDS = registry.histogram("tick_seconds", "Duration of ticks that fetched feeds",
+                                  buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+FEEDS = registry.gauge("feeds", "Distinct feeds across all subscriptions")
+FEEDS_DUE = registry.gauge("feeds_due", "Feeds fetched by the last tick that had any due")
+FILTER_SECONDS = registry.histogram("filter_seconds", "Keyword filtering time per source and tick")
+DEDUP_SECONDS = registry.histogram("dedup_seconds", "Dedup lookup time per source and tick")
+ARTICLES = registry.counter("articles_total", "Parsed articles by what happened to them", ("stage",))
 
 def schedule_fetching(application):
-    async def job():
-        log_info("⏰ Auto-fetch job triggered")
-        await fetch_and_forward(application.bot)
+    async def fetch_job(force: bool):
+        return await fetch_and_forward(application.bot, force)
+
+    async def maintenance_job(force: bool):
+        return await compact_if_due(force)
+
+    shards.start(process_feeds)
+    fetch_loop.start(fetch_job, first_delay=0)
+    # A minute in, so compaction that came due while the process was down runs soon but not during startup
+    maintenance_loop.start(maintenance_job, first_delay=60)
+    log_info(f"✅ Checking for due feeds every {POLL_TICK_SECONDS}s (base interval {policy.base}s)")
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the process behind a "host:pid" lease owner on this host still exists."""
+    pid = owner.rpartition(":")[2]
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+async def release_stale_leases():
+    """
+    Drop the leases of processes on this host that no longer exist (killed
+    mid-tick). Leases of live processes, such as an old fetch worker still
+    finishing a feed, are kept.
+    """
+    dead = [owner for owner in await get_lease_owners(LEASE_HOST) if not _owner_alive(owner)]
+    released = await release_owner_leases(dead)
+    if released:
+        log_info(f"🧹 Released {released} fetch leases left by {len(dead)} exited processes")
 
-    scheduler.add_job(job, trigger='interval', minutes=FETCH_INTERVAL_MIN)
-    scheduler.start()
-    log_info("✅ Scheduled article fetching every 5 minutes")
+async def stop_scheduling(timeout: float = 10):
+    """Stop both loops, giving an in-flight run up to `timeout` seconds to finish."""
+    await fetch_loop.stop(timeout)
+    await maintenance_loop.stop(timeout)
+    await shards.stop(timeout)
 
 # ✅ Async fetching logic
-async def fetch_and_forward(bot: Bot):
-    async with connect("feedforwarder.db") as db:
-        cursor = await db.execute("SELECT DISTINCT user_id FROM sources")
-        user_ids = [row[0] for row in await cursor.fetchall()]
-
-    for user_id in user_ids:
-        sources = await get_sources(user_id)
-        for source_url in sources:
-            articles = await fetch_articles(source_url)
-            filters = await get_filters_by_source(source_url)
-            targets = await get_targets_by_source(source_url)
-
-            for article in articles:
-                text = f"*{article['title']}*\n{article['summary']}\n🔗 {article['link']}"
-
-                # ✅ Filter logic
-                if filters:
-                    text_lower = f"{article['title']} {article['summary']}".lower()
-                    if not any(k.lower() in text_lower for k in filters):
-                        continue
-
-                # ✅ Skip duplicates
-                if await is_article_sent(source_url, article["link"]):
-                    continue
-
-                # ✅ Forward to all targets
-                for chat_id in targets:
-                    try:
-                        # Escape Markdown characters
-                        safe_title = article['title'].replace('*', '\\*').replace('_', '\\_').replace('[', '\\[').replace(']', '\\]')
-                        safe_summary = article['summary'].replace('*', '\\*').replace('_', '\\_').replace('[', '\\[').replace(']', '\\]')
-                        text = f"*{safe_title}*\n{safe_summary}\n🔗 {article['link']}"
-
-                        await bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
-                        log_info(f"✅ Sent to {chat_id}: {article['title']}")
-                    except Exception as e:
-                        log_info(f"❌ Failed to send to {chat_id}: {e}")
-
-                # ✅ Mark as sent
-                await mark_article_sent(source_url, article["link"])
+async def fetch_and_forward(bot: Bot, force: bool = False) -> TickStats | None:
+    """
+    Fetch the feeds that are due (all of them with force=True), forward new
+    articles and reschedule each fetched feed. Returns None when nothing was due.
+    """
+    delivery.start(bot)
+    started = time.perf_counter()
+
+    # ✅ Routing comes from the in-memory snapshot, not per-source SQL
+    snapshot = await routing.get()
+
+    # ✅ Group subscriptions so each distinct feed is fetched once
+    feeds: dict[str, list[str]] = {}
+    for sub in snapshot.subscriptions:
+        source_urls = feeds.setdefault(canonical_feed_url(sub.url), [])
+        if sub.url not in source_urls:
+            source_urls.append(sub.url)
+
+    # ✅ Only feeds whose next poll time has passed; new feeds are spread over one interval
+    schedule = await get_feed_schedule()
+    now = time.time()
+    due, first_seen = [], []
+    for feed_url in feeds:
+        entry = schedule.get(feed_url)
+        if force or (entry is not None and entry[0] <= now):
+            due.append(feed_url)
+        elif entry is None:
+            first_seen.append((feed_url, policy.first_due_at(now), policy.base))
+    await save_feed_schedule(first_seen)
+    FEEDS.set(len(feeds))
+    if not due:
+        TICKS.inc(result="idle")
+        return None
+    FEEDS_DUE.set(len(due))
+
+    # ✅ Fetch and forward here, or across the fetch worker processes when sharding is on
+    work = {feed_url: feeds[feed_url] for feed_url in due}
+    if shards.enabled:
+        outcomes, stats = await shards.run(snapshot, work)
+        if any(new_articles for new_articles, _ in outcomes.values()):
+            delivery.notify()
+    else:
+        outcomes, stats = await process_feeds(snapshot, work)
+    log_info(f"📊 {len(snapshot.subscriptions)} subscriptions → {len(feeds)} feeds, "
+             f"{len(due)} due. Fetched {stats.summary()}")
+
+    # ✅ Busy feeds come back sooner, quiet ones later, never before the server allows.
+    # Feeds without an outcome (leased elsewhere, failed shard) stay due for the next tick.
+    rescheduled = []
+    for feed_url, (new_articles, hint) in outcomes.items():
+        previous = schedule.get(feed_url, (None, None))[1]
+        interval = policy.next_interval(previous, new_articles > 0, hint)
+        rescheduled.append((feed_url, policy.due_at(interval), interval))
+    await save_feed_schedule(rescheduled)
+
+    log_info(f"📮 Delivery queue: {delivery.stats()}")
+    TICKS.inc(result="fetched")
+    TICK_SECONDS.observe(time.perf_counter() - started)
+    return stats
+
+async def process_feeds(snapshot: RoutingSnapshot, work: dict[str, list[str]]):
+    """
+    Fetch each feed in `work` ({feed_url: source_urls}) once and forward its
+    articles to every source following it. With sharding on, feeds whose
+    lease another process holds are left alone. Returns
+    ({feed_url: (new_articles, freshness hint)}, stats); also runs inside
+    fetch worker processes.
+    """
+    # ✅ Leases only matter when several processes fetch; a single process needs none
+    if shards.enabled:
+        leased = set(await acquire_leases(list(work), LEASE_OWNER, FETCH_LEASE_SECONDS))
+        mine = {feed_url: source_urls for feed_url, source_urls in work.items() if feed_url in leased}
+    else:
+        mine = work
+    outcomes = {}
+    try:
+        # ✅ Fetch the feeds concurrently, then fan out in order
+        results, stats = await engine.fetch_all([source_urls[0] for source_urls in mine.values()])
+        for (feed_url, source_urls), articles in zip(mine.items(), results):
+            new_articles = 0
+            # ✅ Each article is rendered once, however many sources follow the feed
+            rendered: dict[str, str] = {}
+            for source_url in source_urls if articles else ():
+                new_articles += await forward_articles(snapshot, source_url, articles, rendered)
+            # ✅ The feed only counts as seen once its articles are queued
+            await save_feed_state(source_urls[0])
+            outcomes[feed_url] = (new_articles, poll_hints.pop(source_urls[0], None))
+    finally:
+        # Feeds a failure kept from being forwarded are parsed again next time
+        for source_urls in mine.values():
+            pending_state.pop(source_urls[0], None)
+        if shards.enabled:
+            await release_leases(list(mine), LEASE_OWNER)
+    stats.leased = len(work) - len(mine)
+    stats.sources += stats.leased
+    return outcomes, stats
+
+async def forward_articles(snapshot: RoutingSnapshot, source_url: str, articles: list[dict],
+                           rendered: dict[str, str] | None = None) -> int:
+    """
+    Apply one source's filters and dedup, then queue the new articles for its
+    targets. `rendered` caches message texts by article ID across the sources
+    of one feed. Returns how many articles were new.
+    """
+    if rendered is None:
+        rendered = {}
+    matcher = snapshot.matcher(source_url)
+    targets = snapshot.targets(source_url)
+
+    # ✅ Filter logic: one compiled pass per article
+    if matcher is not None:
+        with FILTER_SECONDS.time():
+            kept = [
+                article for article in articles
+                if matcher.matches(f"{article['title']} {article['summary']}")
+            ]
+        ARTICLES.inc(len(articles) - len(kept), stage="filtered_out")
+        articles = kept
+
+    # ✅ Dedup on the article ID; the raw link still matches keys written before IDs existed
+    with DEDUP_SECONDS.time():
+        unsent = set(await get_unsent_ids(
+            source_url, [article["id"] for article in articles], [article["link"] for article in articles]
+        ))
+    ARTICLES.inc(len(articles) - len(unsent), stage="duplicate")
+    ARTICLES.inc(len(unsent), stage="new")
+    messages = []
+
+    for article in articles:
+        if article["id"] not in unsent:
+            continue
+        unsent.discard(article["id"])
+
+        # ✅ One text per article, shared by every target and every source of the feed
+        text = rendered.get(article["id"])
+        if text is None:
+            text = rendered[article["id"]] = render_article(article)
+        messages.append((article["id"], text))
+
+    # ✅ Outbox rows and dedup marks are written together, then delivery picks them up
+    await queue_articles(source_url, messages, targets, parse_mode=MESSAGE_PARSE_MODE)
+    if messages and targets:
+        delivery.notify()
+    return len(messages)
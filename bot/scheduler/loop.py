@@ -0,0 +1,95 @@
+# /bot/scheduler/loop.py
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from utils import log_info
+
+
+class PeriodicTask:
+    """
+    Runs an async job every `period` seconds in a single asyncio task.
+
+    Only one run is ever in flight. trigger() asks for an extra run and
+    waits for it; triggers that arrive while a run is going (a /fetchnow
+    during a scheduled tick, or several /fetchnow at once) are coalesced into
+    one follow-up run, with `force` set if any of them asked for it.
+    """
+
+    def __init__(self, name: str, period: float):
+        self.name = name
+        self.period = period
+        self.runs = 0
+        self.coalesced = 0
+        self._job: Callable[[bool], Awaitable] | None = None
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._force = False
+        self._next: asyncio.Future | None = None
+        self._stopping = False
+
+    def start(self, job: Callable[[bool], Awaitable], first_delay: float | None = None):
+        """Start the loop; `job(force)` is awaited on each run. The first run is after first_delay (default: one period)."""
+        if self._task is not None:
+            return
+        self._job = job
+        self._next = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._loop(self.period if first_delay is None else first_delay))
+
+    async def trigger(self, force: bool = False):
+        """Request a run as soon as the current one (if any) finishes, and return its result."""
+        if self._task is None or self._stopping:
+            raise RuntimeError(f"{self.name} loop is not running")
+        if self._wakeup.is_set():
+            self.coalesced += 1
+        self._force = self._force or force
+        self._wakeup.set()
+        # shield: one caller giving up must not cancel the run for everyone else
+        return await asyncio.shield(self._next)
+
+    async def _loop(self, delay: float):
+        loop = asyncio.get_running_loop()
+        current = None
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+                except asyncio.TimeoutError:
+                    pass
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                force, self._force = self._force, False
+                current, self._next = self._next, loop.create_future()
+
+                started = time.monotonic()
+                try:
+                    result = await self._job(force)
+                except Exception as e:
+                    log_info(f"❌ {self.name} run failed: {type(e).__name__}: {e}")
+                    result = None
+                self.runs += 1
+                if not current.done():
+                    current.set_result(result)
+                delay = self.period - (time.monotonic() - started)
+        finally:
+            # Nobody waits on a run that will never happen
+            for future in (current, self._next):
+                if future is not None and not future.done():
+                    future.cancel()
+
+    async def stop(self, timeout: float = 10):
+        """Let an in-flight run finish for up to `timeout` seconds, then cancel it."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            log_info(f"⏹️ {self.name} run still going after {timeout}s, cancelling it")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        log_info(f"⏹️ {self.name} loop stopped after {self.runs} runs ({self.coalesced} triggers coalesced)")
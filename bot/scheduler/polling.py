@@ -0,0 +1,45 @@
+# /bot/scheduler/polling.py
+
+import random
+import time
+from dataclasses import dataclass
+
+from utils import get_env_variable
+
+POLL_BASE_SECONDS = int(get_env_variable("POLL_BASE_SECONDS", "300"))
+POLL_MIN_SECONDS = int(get_env_variable("POLL_MIN_SECONDS", "120"))
+POLL_MAX_SECONDS = int(get_env_variable("POLL_MAX_SECONDS", str(6 * 3600)))
+POLL_JITTER = float(get_env_variable("POLL_JITTER", "0.1"))
+# Busy feeds are polled twice as often, quiet ones back off by half again each time
+SPEED_UP = 0.5
+SLOW_DOWN = 1.5
+
+
+@dataclass
+class PollPolicy:
+    """
+    Decides when each feed is polled next. The interval shrinks while a feed
+    keeps publishing and grows while it stays quiet, never goes below what the
+    server asked for (Cache-Control, Expires, RSS <ttl>), and is jittered so
+    feeds drift apart instead of being polled in one burst.
+    """
+    base: int = POLL_BASE_SECONDS
+    minimum: int = POLL_MIN_SECONDS
+    maximum: int = POLL_MAX_SECONDS
+    jitter: float = POLL_JITTER
+
+    def next_interval(self, interval: int | None, changed: bool, hint: int | None = None) -> int:
+        interval = interval or self.base
+        interval = interval * SPEED_UP if changed else interval * SLOW_DOWN
+        if hint:
+            interval = max(interval, hint)
+        return int(min(self.maximum, max(self.minimum, interval)))
+
+    def due_at(self, interval: int, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        return now + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def first_due_at(self, now: float | None = None) -> float:
+        """Feeds seen for the first time are spread over one base interval."""
+        now = time.time() if now is None else now
+        return now + random.uniform(0, self.base)
@@ -0,0 +1,203 @@
+# /bot/scheduler/shards.py
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Awaitable, Callable
+
+from bot.database.routing import RoutingSnapshot
+from bot.scheduler.engine import TickStats
+from utils import get_env_variable, log_info
+
+# 0: fetch and parse in the main process, as before
+FETCH_WORKERS = int(get_env_variable("FETCH_WORKERS", "0"))
+# How long the scheduler waits for a shard before giving up on it for this tick
+SHARD_TIMEOUT_SECONDS = float(get_env_variable("SHARD_TIMEOUT_SECONDS", "600"))
+RING_REPLICAS = 64
+
+# (routing for this shard's sources, {feed_url: source_urls}) -> ({feed_url: (new_articles, hint)}, stats)
+ProcessFeeds = Callable[[RoutingSnapshot, dict[str, list[str]]],
+                        Awaitable[tuple[dict[str, tuple[int, float | None]], TickStats]]]
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of feed URLs onto worker indexes. Each worker gets
+    RING_REPLICAS points on the ring, so changing the worker count only moves
+    about 1/N of the feeds (and their warm HTTP connections and caches).
+    """
+
+    def __init__(self, nodes: int, replicas: int = RING_REPLICAS):
+        points = sorted((_point(f"worker-{node}#{i}"), node) for node in range(nodes) for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: str) -> int:
+        return self._nodes[bisect.bisect(self._points, _point(key)) % len(self._points)]
+
+
+def _shard_routing(snapshot: RoutingSnapshot, work: dict[str, list[str]]) -> RoutingSnapshot:
+    """The part of the routing snapshot a shard needs, without compiled matchers (they are rebuilt there)."""
+    source_urls = [url for urls in work.values() for url in urls]
+    return RoutingSnapshot(
+        targets_by_url={url: snapshot.targets(url) for url in source_urls},
+        filters_by_url={url: snapshot.filters(url) for url in source_urls if snapshot.filters(url)},
+    )
+
+
+def _worker_main(index: int, process: ProcessFeeds, jobs, results, log_level: int):
+    logging.basicConfig(level=log_level, format=f"%(levelname)s:fetch-worker-{index}:%(message)s")
+    asyncio.run(_serve(index, process, jobs, results))
+
+
+async def _serve(index: int, process: ProcessFeeds, jobs, results):
+    from bot.database.core import close_db
+    from bot.parsers.http import http_client
+    from bot.parsers.pool import parser_pool
+
+    loop = asyncio.get_running_loop()
+    log_info(f"🧩 Fetch worker {index} started")
+    try:
+        while True:
+            job = await loop.run_in_executor(None, jobs.get)
+            if job is None:
+                break
+            tick, snapshot, work = job
+            try:
+                outcomes, stats = await process(snapshot, work)
+                results.put((tick, index, outcomes, stats, None))
+            except Exception as e:
+                results.put((tick, index, {}, TickStats(sources=len(work), errors=len(work)), f"{type(e).__name__}: {e}"))
+    finally:
+        await http_client.close()
+        parser_pool.close()
+        await close_db()
+        log_info(f"🧩 Fetch worker {index} stopped")
+
+
+class ShardPool:
+    """
+    Fetch worker processes, each owning a consistent-hash shard of the
+    distinct feed URLs. The scheduler sends every worker its slice of the due
+    feeds with the routing it needs; the worker fetches, parses, filters,
+    dedups and writes outbox rows itself (through its own connection to the
+    shared SQLite file) and sends back only per-feed outcomes and stats.
+    Workers take a lease on each feed before fetching it, so an old worker
+    still busy with a feed after a restart or a resize cannot fetch it twice.
+    Fetch and parse metrics stay in the worker processes.
+    """
+
+    def __init__(self, workers: int = FETCH_WORKERS, timeout: float = SHARD_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.timeout = timeout
+        self.ring = HashRing(workers) if workers > 0 else None
+        self.restarts = 0
+        self._process: ProcessFeeds | None = None
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: list = []
+        self._jobs: list = []
+        self._results = None
+        self._tick = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self, process: ProcessFeeds):
+        """Start the workers; `process` must be a module-level coroutine function (it is pickled by name)."""
+        if self._processes or not self.enabled:
+            return
+        self._process = process
+        self._results = self._context.Queue()
+        for index in range(self.workers):
+            self._jobs.append(self._context.Queue())
+            self._processes.append(self._spawn(index))
+        log_info(f"🧩 Started {self.workers} fetch workers")
+
+    def _spawn(self, index: int):
+        # Not a daemon: a worker may run its own parser process pool
+        worker = self._context.Process(
+            target=_worker_main, name=f"fetch-worker-{index}",
+            args=(index, self._process, self._jobs[index], self._results, logging.getLogger().getEffectiveLevel()),
+        )
+        worker.start()
+        return worker
+
+    def _revive(self):
+        for index, worker in enumerate(self._processes):
+            if not worker.is_alive():
+                log_info(f"⚠️ Fetch worker {index} exited with {worker.exitcode}, restarting it")
+                self._processes[index] = self._spawn(index)
+                self.restarts += 1
+
+    async def run(self, snapshot: RoutingSnapshot, work: dict[str, list[str]]):
+        """Process {feed_url: source_urls} across the shards. Feeds of a shard that fails or times out are left out of the outcomes."""
+        self._revive()
+        self._tick += 1
+        parts: list[dict[str, list[str]]] = [{} for _ in range(self.workers)]
+        for feed_url, source_urls in work.items():
+            parts[self.ring.node(feed_url)][feed_url] = source_urls
+
+        pending = set()
+        for index, part in enumerate(parts):
+            if part:
+                self._jobs[index].put((self._tick, _shard_routing(snapshot, part), part))
+                pending.add(index)
+
+        loop = asyncio.get_running_loop()
+        outcomes: dict[str, tuple[int, float | None]] = {}
+        stats = TickStats()
+        deadline = time.monotonic() + self.timeout
+        while pending and time.monotonic() < deadline:
+            try:
+                tick, index, shard_outcomes, shard_stats, error = await loop.run_in_executor(
+                    None, self._results.get, True, 1.0
+                )
+            except queue.Empty:
+                for index in [index for index in pending if not self._processes[index].is_alive()]:
+                    log_info(f"❌ Fetch worker {index} died with {len(parts[index])} feeds")
+                    stats.merge(TickStats(sources=len(parts[index]), errors=len(parts[index])))
+                    pending.discard(index)
+                continue
+            if tick != self._tick or index not in pending:
+                # A late answer from a tick we already gave up on; its outbox rows are written anyway
+                continue
+            pending.discard(index)
+            if error:
+                log_info(f"❌ Fetch worker {index} failed: {error}")
+            outcomes.update(shard_outcomes)
+            stats.merge(shard_stats)
+
+        for index in pending:
+            log_info(f"⏱️ Fetch worker {index} did not answer within {self.timeout}s")
+            stats.merge(TickStats(sources=len(parts[index]), errors=len(parts[index])))
+        return outcomes, stats
+
+    async def stop(self, timeout: float = 10):
+        """Ask the workers to finish their current job and exit; terminate the ones that don't."""
+        if not self._processes:
+            return
+        for jobs in self._jobs:
+            jobs.put(None)
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        for worker in self._processes:
+            await loop.run_in_executor(None, worker.join, max(0.0, deadline - time.monotonic()))
+            if worker.is_alive():
+                log_info(f"⏹️ {worker.name} still running after {timeout}s, terminating it")
+                worker.terminate()
+                await loop.run_in_executor(None, worker.join)
+        self._processes, self._jobs, self._results = [], [], None
+        log_info(f"🧩 Fetch workers stopped ({self.restarts} restarts)")
+
+
+# ✅ Started by schedule_fetching when FETCH_WORKERS > 0
+shards = ShardPool()
@@ -1,34 +1,50 @@
 import asyncio
 import logging
 import os
-import nest_asyncio
+import signal
 
 from aiohttp import web
 from telegram import Update
 from telegram.ext import Application
 
 from bot.handlers.commands import register_handlers
-from bot.scheduler.jobs import schedule_fetching, scheduler  # Import scheduler too
-from bot.database.core import init_db
+from bot.scheduler.jobs import release_stale_leases, schedule_fetching, stop_scheduling
+from bot.database.core import init_db, close_db
+from bot.parsers.http import http_client
+from bot.parsers.pool import parser_pool
+from bot.delivery.queue import delivery
+from bot.handlers.updates import update_queue
+from bot.metrics import registry
 from utils import get_env_variable
 
-# 🔧 Support nested event loops (needed in some environments)
-nest_asyncio.apply()
-
 # 📡 Health check endpoint
 async def handle_healthcheck(request):
     return web.Response(text="OK")
 
-# 🔁 Telegram webhook handler
-def create_telegram_webhook_handler(app: Application):
+# 📈 Prometheus scrape endpoint
+async def handle_metrics(request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+# 🔁 Telegram webhook handler: validate, queue and acknowledge; workers run the handlers
+def create_telegram_webhook_handler(app: Application, secret_token: str | None = None):
     async def telegram_webhook_handler(request: web.Request):
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=401, text="Unauthorized")
         try:
             data = await request.json()
         except Exception as e:
             logging.error("Failed to parse JSON: %s", e)
             return web.Response(status=400, text="Invalid JSON")
-        update = Update.de_json(data, app.bot)
-        await app.process_update(update)
+        if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+            return web.Response(status=400, text="Not an update")
+        try:
+            update = Update.de_json(data, app.bot)
+        except Exception as e:
+            logging.error("Failed to decode update: %s", e)
+            return web.Response(status=400, text="Invalid update")
+        if not update_queue.submit(update):
+            # Queue is full: a non-2xx makes Telegram retry later instead of us buffering more
+            return web.Response(status=503, text="Busy")
         return web.Response(text="OK")
     return telegram_webhook_handler
 
@@ -40,6 +56,7 @@ async def run():
     token = get_env_variable("TELEGRAM_TOKEN")
     webhook_url = get_env_variable("WEBHOOK_URL")
     webhook_path = "/webhook"
+    webhook_secret = get_env_variable("WEBHOOK_SECRET", "") or None
     full_webhook_url = webhook_url + webhook_path
 
     admin_ids = [int(uid.strip()) for uid in get_env_variable("ADMIN_USER_IDS", "").split(",") if uid.strip().isdigit()]
@@ -49,6 +66,7 @@ async def run():
 
     # Init database and handlers
     await init_db()
+    await release_stale_leases()
     register_handlers(application, admin_ids)
 
     # 🗓️ Schedule auto-fetching
@@ -59,16 +77,19 @@ async def run():
     logging.info("Initializing Telegram application...")
     await application.initialize()
     await application.start()
+    delivery.start(application.bot)
+    update_queue.start(application)
 
     # Set webhook URL
-    await application.bot.set_webhook(full_webhook_url)
+    await application.bot.set_webhook(full_webhook_url, secret_token=webhook_secret)
     logging.info("Webhook set to: %s", full_webhook_url)
 
     # Setup aiohttp server
     app = web.Application()
     app.add_routes([
         web.get("/healthz", handle_healthcheck),
-        web.post(webhook_path, create_telegram_webhook_handler(application)),
+        web.get("/metrics", handle_metrics),
+        web.post(webhook_path, create_telegram_webhook_handler(application, webhook_secret)),
     ])
 
     runner = web.AppRunner(app)
@@ -77,17 +98,24 @@ async def run():
     await site.start()
     logging.info("Web server running on http://0.0.0.0:10000")
 
-    # Keep the app running
+    # Keep the app running until Render/Docker send SIGTERM or Ctrl+C sends SIGINT
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
     try:
-        while True:
-            await asyncio.sleep(3600)
-    except KeyboardInterrupt:
+        await stop.wait()
         logging.info("Shutting down...")
     finally:
-        scheduler.shutdown()  # 🧹 Stop scheduled jobs cleanly
+        await stop_scheduling()  # 🧹 Let a running tick finish, then stop the loops
+        await update_queue.stop()  # 📥 Finish updates that were already acknowledged
+        await delivery.stop()  # 📮 Give queued messages a chance to go out
         await application.stop()
         await application.shutdown()
         await runner.cleanup()
+        await http_client.close()  # 🔌 Drop pooled HTTP connections
+        parser_pool.close()  # 🧵 Stop parser workers
+        await close_db()  # 🗄️ Flush and close the shared SQLite connection
 
 # 🧠 Start the async app
 if __name__ == "__main__":